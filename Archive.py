@@ -0,0 +1,103 @@
+from typing import BinaryIO, Iterator, List, Tuple
+import concurrent.futures
+import os
+import struct
+import time
+import zipfile
+import zlib
+
+# Minimal zip writer used for parallel compression, since zipfile compresses each member while holding its lock.
+# Archives that would need zip64 are left to zipfile.
+
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+CENTRAL_HEADER = struct.Struct("<4s6H3L5H2L")
+END_OF_CENTRAL_DIRECTORY = struct.Struct("<4s4H2LH")
+ZIP_LIMIT = 0xFFFFFFFF
+
+class Member:
+    name: str
+    data: bytes
+    crc: int
+    size: int
+    method: int
+    dos_time: int
+    dos_date: int
+    mode: int
+
+    def __init__(self, path: str, name: str, level: int):
+        stat = os.stat(path)
+        with open(path, "rb") as file:
+            data = file.read()
+        self.name = name
+        self.crc = zlib.crc32(data)
+        self.size = len(data)
+        if level == 0:
+            self.method = zipfile.ZIP_STORED
+            self.data = data
+        else:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+            self.method = zipfile.ZIP_DEFLATED
+            self.data = compressor.compress(data) + compressor.flush()
+        year, month, day, hour, minute, second = time.localtime(stat.st_mtime)[:6]
+        if year < 1980:
+            year, month, day, hour, minute, second = 1980, 1, 1, 0, 0, 0
+        self.dos_time = (hour << 11) | (minute << 5) | (second // 2)
+        self.dos_date = ((year - 1980) << 9) | (month << 5) | day
+        self.mode = stat.st_mode & 0xFFFF
+
+def check_level(level: int) -> None:
+    if not 0 <= level <= 9:
+        raise ValueError(f"The patch compression level must be from 0 to 9, not {level}.")
+
+def list_files(source_directory: str) -> List[Tuple[str, str]]:
+    files = []
+    for root, directories, names in os.walk(source_directory):
+        directories.sort()
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            files.append((path, os.path.relpath(path, source_directory).replace(os.sep, "/")))
+    return files
+
+def write_zip(source_directory: str, output_file: BinaryIO, level: int, workers: int) -> None:
+    """Writes the contents of source_directory to output_file as a zip archive, without buffering the archive.
+    A level of 0 stores members uncompressed. With several workers, members are compressed in parallel."""
+    check_level(level)
+    files = list_files(source_directory)
+    total_size = sum(os.path.getsize(path) for path, _ in files)
+    if workers <= 1 or total_size >= ZIP_LIMIT or len(files) > 0xFFFF:
+        compression = zipfile.ZIP_STORED if level == 0 else zipfile.ZIP_DEFLATED
+        with zipfile.ZipFile(output_file, "w", compression, compresslevel=level if level else None) as archive:
+            for path, name in files:
+                archive.write(path, name)
+        return
+
+    offset = 0
+    central_directory = []
+    for member in compress_members(files, level, workers):
+        name = member.name.encode("utf-8")
+        flags = 0 if member.name.isascii() else 0x800
+        output_file.write(LOCAL_HEADER.pack(b"PK\x03\x04", 20, flags, member.method, member.dos_time,
+            member.dos_date, member.crc, len(member.data), member.size, len(name), 0))
+        output_file.write(name)
+        output_file.write(member.data)
+        central_directory.append(CENTRAL_HEADER.pack(b"PK\x01\x02", (3 << 8) | 20, 20, flags, member.method,
+            member.dos_time, member.dos_date, member.crc, len(member.data), member.size, len(name), 0, 0, 0, 0,
+            member.mode << 16, offset) + name)
+        offset += LOCAL_HEADER.size + len(name) + len(member.data)
+
+    directory_size = sum(len(entry) for entry in central_directory)
+    for entry in central_directory:
+        output_file.write(entry)
+    output_file.write(END_OF_CENTRAL_DIRECTORY.pack(b"PK\x05\x06", 0, 0, len(central_directory),
+        len(central_directory), directory_size, offset, 0))
+
+def compress_members(files: List[Tuple[str, str]], level: int, workers: int) -> Iterator[Member]:
+    # zlib releases the GIL while compressing; at most two members per worker are held in memory at once
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        for path, name in files:
+            pending.append(executor.submit(Member, path, name, level))
+            if len(pending) >= workers * 2:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
@@ -0,0 +1,118 @@
+"""Patches many .apalbw files at once in a pool of worker processes.
+
+Run from the Archipelago directory, e.g.
+    python -m worlds.albw.Batch output/*.apalbw --jobs 4
+Each output is written next to its patch file, as when opening a single patch from the launcher.
+"""
+from typing import List, Optional, Tuple
+from argparse import ArgumentParser
+import concurrent.futures
+import ctypes
+import multiprocessing
+import os
+import re
+import subprocess
+import sys
+import time
+from settings import get_settings
+from .Patch import ALBWProcedurePatch
+from .Profiling import profiler
+from .Rom import validate_rom
+
+# rough peak memory of one patch job, used to bound the number of jobs
+JOB_MEMORY: int = 1536
+
+def get_available_memory() -> Optional[int]:
+    """Memory that can be used without swapping, including reclaimable caches, or None if it can't be found."""
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+    try:
+        if sys.platform == "win32":
+            class MemoryStatus(ctypes.Structure):
+                _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong),
+                    ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong),
+                    ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong),
+                    ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong),
+                    ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
+
+            status = MemoryStatus()
+            status.dwLength = ctypes.sizeof(MemoryStatus)
+            if not ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+                return None
+            return status.ullAvailPhys
+        if sys.platform == "darwin":
+            # free, inactive and speculative pages can all be handed out without swapping
+            output = subprocess.run(["vm_stat"], capture_output=True, text=True, check=True).stdout
+            page_size = int(re.search(r"page size of (\d+) bytes", output).group(1))
+            pages = {name: int(count) for name, count in re.findall(r"Pages ([\w ]+):\s+(\d+)\.", output)}
+            return (pages.get("free", 0) + pages.get("inactive", 0) + pages.get("speculative", 0)) * page_size
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, AttributeError, subprocess.SubprocessError):
+        pass
+    return None
+
+def get_job_count(requested: int, job_memory: int) -> int:
+    jobs = requested if requested > 0 else os.cpu_count() or 1
+    available_memory = get_available_memory()
+    if available_memory is None:
+        print(f"Could not determine available memory; running {jobs} jobs without a memory bound")
+    else:
+        jobs = min(jobs, max(1, available_memory // (job_memory * 2**20)))
+    return jobs
+
+def init_worker() -> None:
+    # settings, logging and the profiler are set up once per worker, through the same cache patch() uses;
+    # the randomizer still reads the ROM itself for every patch
+    ALBWProcedurePatch.get_source_data_with_cache()
+
+def patch_file(patch_path: str) -> Tuple[str, float, Optional[str]]:
+    start = time.perf_counter()
+    # each file gets its own native call profile, since workers patch several files
+    profiler.reset()
+    profiler.set_stage("patch")
+    target = os.path.splitext(patch_path)[0] + ALBWProcedurePatch.result_file_ending
+    try:
+        # written to a temporary file and renamed into place, so an interrupted batch leaves no partial output
+        ALBWProcedurePatch(patch_path).patch(target)
+    except Exception as e:
+        return target, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+    return target, time.perf_counter() - start, None
+
+def main() -> int:
+    parser = ArgumentParser(description="Patch many A Link Between Worlds .apalbw files in parallel.")
+    parser.add_argument("patch_files", nargs="+", help="Paths to .apalbw files")
+    parser.add_argument("--jobs", type=int, default=0,
+        help="Number of worker processes; defaults to the CPU count, lowered to fit in available memory")
+    parser.add_argument("--job_memory", type=int, default=JOB_MEMORY,
+        help="Estimated peak memory of one patch job in megabytes")
+    args = parser.parse_args()
+
+    validate_rom(get_settings().albw_settings.rom_file)
+    jobs = min(get_job_count(args.jobs, args.job_memory), len(args.patch_files))
+    print(f"Patching {len(args.patch_files)} files with {jobs} jobs")
+
+    start = time.perf_counter()
+    failures: List[str] = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker) as executor:
+        futures = {executor.submit(patch_file, path): path for path in args.patch_files}
+        for future in concurrent.futures.as_completed(futures):
+            target, seconds, error = future.result()
+            if error is not None:
+                failures.append(futures[future])
+                print(f"{futures[future]}: failed after {seconds:.1f}s: {error}")
+            else:
+                print(f"{futures[future]} -> {target}: {seconds:.1f}s")
+
+    print(f"Patched {len(args.patch_files) - len(failures)} of {len(args.patch_files)} files "
+        f"in {time.perf_counter() - start:.1f}s")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""Times ALBW generation across a matrix of options and player counts.
+
+Run from the Archipelago directory, e.g.
+    python -m worlds.albw.Benchmark --output bench.json --baseline previous_bench.json
+With --memory, each configuration is generated in a fresh process so its peak RSS can be reported.
+"""
+from typing import Any, Dict, Iterator, List, Tuple
+from argparse import ArgumentParser, Namespace
+import itertools
+import json
+import multiprocessing
+import sys
+import tempfile
+import time
+from BaseClasses import CollectionState, MultiWorld
+from Fill import distribute_items_restrictive
+from worlds.AutoWorld import call_all
+from . import ALBWWorld
+from .Profiling import get_peak_rss
+
+OPTION_MATRIX: Dict[str, List[Any]] = {
+    "logic_mode": ["normal", "glitched"],
+    "maiamai_mayhem": [False, True],
+    "randomize_dungeon_prizes": [False, True],
+    "keysy": ["off", "all"],
+    "weather_vanes": ["standard", "shuffled"],
+}
+PLAYER_COUNTS: List[int] = [1, 4]
+STAGES: List[str] = ["generate_early", "create_regions", "create_items", "set_rules", "generate_basic", "pre_fill",
+    "main_fill", "post_fill", "generate_output", "fill_slot_data"]
+REPORT_VERSION: int = 1
+
+class RuleCounter:
+    calls: int
+
+    def __init__(self):
+        self.calls = 0
+
+    def install(self) -> None:
+        check_rule = ALBWWorld._check_rule
+
+        def counting_check_rule(world, state, key, evaluate):
+            self.calls += 1
+            return check_rule(world, state, key, evaluate)
+
+        ALBWWorld._check_rule = counting_check_rule
+
+def iterate_configs() -> Iterator[Tuple[Dict[str, Any], int]]:
+    names = list(OPTION_MATRIX.keys())
+    for values in itertools.product(*OPTION_MATRIX.values()):
+        for players in PLAYER_COUNTS:
+            yield dict(zip(names, values)), players
+
+def create_multiworld(options: Dict[str, Any], players: int, seed: int) -> MultiWorld:
+    multiworld = MultiWorld(players)
+    multiworld.game = {player: ALBWWorld.game for player in multiworld.player_ids}
+    multiworld.player_name = {player: f"Player{player}" for player in multiworld.player_ids}
+    multiworld.set_seed(seed)
+    args = Namespace()
+    for key, option in ALBWWorld.options_dataclass.type_hints.items():
+        value = options.get(key, option.default)
+        setattr(args, key, {player: option.from_any(value) for player in multiworld.player_ids})
+    multiworld.set_options(args)
+    multiworld.state = CollectionState(multiworld)
+    return multiworld
+
+def native_calls(multiworld: MultiWorld) -> int:
+    return sum(world.rule_cache.misses for world in multiworld.get_game_worlds(ALBWWorld.game))
+
+def run_config(options: Dict[str, Any], players: int, seed: int, counter: RuleCounter) -> Dict[str, Any]:
+    # every run converts its region graph from scratch, so repeats and the baseline measure a cold create_regions
+    ALBWWorld.region_skeletons.clear()
+    multiworld = create_multiworld(options, players, seed)
+    stages: Dict[str, float] = {}
+    rule_calls: Dict[str, int] = {}
+    native: Dict[str, int] = {}
+    with tempfile.TemporaryDirectory() as output_directory:
+        for stage in STAGES:
+            start_calls = counter.calls
+            start_native = native_calls(multiworld) if stage != "generate_early" else 0
+            start = time.perf_counter()
+            if stage == "main_fill":
+                distribute_items_restrictive(multiworld)
+            elif stage == "generate_output":
+                call_all(multiworld, stage, output_directory)
+            else:
+                call_all(multiworld, stage)
+            stages[stage] = time.perf_counter() - start
+            rule_calls[stage] = counter.calls - start_calls
+            native[stage] = native_calls(multiworld) - start_native
+    return {
+        "options": options,
+        "players": players,
+        "seed": seed,
+        "stages": stages,
+        "total": sum(stages.values()),
+        "rule_calls": rule_calls,
+        "native_calls": native,
+    }
+
+def run_config_isolated(options: Dict[str, Any], players: int, seed: int) -> Dict[str, Any]:
+    counter = RuleCounter()
+    counter.install()
+    baseline_rss = get_peak_rss()
+    result = run_config(options, players, seed, counter)
+    peak_rss = get_peak_rss()
+    result["peak_rss"] = peak_rss
+    result["peak_rss_per_slot"] = (peak_rss - baseline_rss) / players \
+        if peak_rss is not None and baseline_rss is not None else None
+    return result
+
+def config_key(result: Dict[str, Any]) -> str:
+    return json.dumps([result["options"], result["players"], result["seed"]], sort_keys=True)
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], threshold: float, min_seconds: float) -> List[str]:
+    baseline_results = {config_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline_results.get(config_key(result))
+        if previous is None:
+            continue
+        for stage, seconds in result["stages"].items():
+            previous_seconds = previous["stages"].get(stage)
+            if previous_seconds is None or seconds < min_seconds:
+                continue
+            if seconds > previous_seconds * threshold:
+                regressions.append(f"{config_key(result)} {stage}: {previous_seconds:.3f}s -> {seconds:.3f}s")
+    return regressions
+
+def main() -> int:
+    parser = ArgumentParser(description="Benchmark A Link Between Worlds generation over an option matrix.")
+    parser.add_argument("--seeds", type=int, default=1, help="Number of seeds to generate per configuration")
+    parser.add_argument("--output", type=str, default="", help="Write the JSON report to this file")
+    parser.add_argument("--baseline", type=str, default="", help="Compare stage timings against this JSON report")
+    parser.add_argument("--threshold", type=float, default=1.25,
+        help="Report a regression when a stage takes this many times longer than in the baseline")
+    parser.add_argument("--min_seconds", type=float, default=0.05,
+        help="Ignore stages faster than this when looking for regressions")
+    parser.add_argument("--memory", action="store_true",
+        help="Generate each configuration in a fresh process and report its peak RSS per ALBW slot")
+    args = parser.parse_args()
+
+    counter = RuleCounter()
+    counter.install()
+    results = []
+    for options, players in iterate_configs():
+        for seed in range(args.seeds):
+            if args.memory:
+                with multiprocessing.get_context("spawn").Pool(1) as pool:
+                    result = pool.apply(run_config_isolated, (options, players, seed))
+            else:
+                result = run_config(options, players, seed, counter)
+            results.append(result)
+            message = f"{options} players={players} seed={seed}: {result['total']:.2f}s, " \
+                f"{sum(result['rule_calls'].values())} rule calls, {sum(result['native_calls'].values())} native calls"
+            if result.get("peak_rss_per_slot") is not None:
+                message += f", {result['peak_rss_per_slot'] / 2**20:.1f} MiB peak RSS per slot"
+            print(message)
+
+    report = {"version": REPORT_VERSION, "results": results}
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline, args.threshold, args.min_seconds)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+from typing import Any, List, Tuple
+import hashlib
+import os
+import shutil
+import tempfile
+from Utils import cache_path
+import albwrandomizer
+from albwrandomizer import Settings
+
+class DiskCache:
+    directory: str
+    max_size: int
+
+    def __init__(self, name: str, max_size: int):
+        self.directory = cache_path("albw", name)
+        self.max_size = max_size
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get_file(self, key: str, target: str) -> bool:
+        """Copies the entry to target, since entries are too large to read into memory."""
+        if not self.enabled:
+            return False
+        path = self._get_path(key)
+        try:
+            shutil.copyfile(path, target)
+            os.utime(path)
+            return True
+        except OSError:
+            return False
+
+    def put_file(self, key: str, source: str) -> None:
+        if not self.enabled or os.path.getsize(source) > self.max_size:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copyfile(source, temp_path)
+            os.replace(temp_path, self._get_path(key))
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self.evict()
+
+    def evict(self) -> None:
+        entries: List[Tuple[float, int, str]] = []
+        with os.scandir(self.directory) as directory:
+            for entry in directory:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+
+def make_key(*parts: Any) -> str:
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
+
+def get_library_version() -> str:
+    version = getattr(albwrandomizer, "__version__", None)
+    if version is not None:
+        return str(version)
+    # builds without a version string are told apart by the extension module itself
+    stat = os.stat(albwrandomizer.__file__)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+def get_settings_fingerprint(settings: Settings) -> Tuple[Tuple[str, str], ...]:
+    fields = []
+    for name in dir(settings):
+        if name.startswith("_"):
+            continue
+        value = getattr(settings, name)
+        if callable(value):
+            continue
+        if isinstance(value, (set, frozenset)):
+            value = sorted(value, key=repr)
+        fields.append((name, repr(value)))
+    return tuple(fields)
@@ -1,10 +1,18 @@
 from typing import Dict, List, Optional, Set
 import asyncio
+import multiprocessing
+import os
+import queue
+import time
 import traceback
 from CommonClient import CommonContext, get_base_parser, gui_enabled, logger, server_loop
 from NetUtils import ClientStatus
 from Patch import create_rom_file
 from .Citra import CitraInterface, CitraException
+from .Metrics import ClientMetrics
+from . import Patch as ALBWPatch
+from .Patch import ALBWProcedurePatch, load_patch_info
+from .Tracker import ALBWTracker
 from .Locations import LocationData, LocationType, all_locations, location_table
 from .Items import item_code_table
 from . import albw_base_id
@@ -18,6 +26,11 @@ class ALBWClientContext(CommonContext):
     want_slot_data: bool = True
 
     citra: CitraInterface
+    metrics: ClientMetrics
+    tracker: Optional[ALBWTracker]
+    patch_task: Optional[asyncio.Task]
+    tracker_task: Optional[asyncio.Task]
+    tracker_update_task: Optional[asyncio.Task]
     citra_connected: bool
     server_connected: bool
     slot_data: Optional[Dict[str, any]]
@@ -30,6 +43,8 @@ class ALBWClientContext(CommonContext):
     minigame_flags: int
     course: int
     stage: int
+    flags_save_ptr: int
+    next_course: int
     ravio_scouted: bool
     invalid: bool
     last_error: str
@@ -42,6 +57,10 @@ class ALBWClientContext(CommonContext):
     COURSES_LOCATION: int = 0x70c8e0
     MINIGAME_LOCATION: int = 0x70d858
     GAME_LOCATION: int = 0x709df8
+    GAME_COURSE_OFFSET: int = 0x10
+    GAME_STAGE_OFFSET: int = 0x14
+    COURSE_COUNT: int = 0x20
+    COURSES_PER_TICK: int = 2
 
     def __init__(self, server_address: Optional[str], password: Optional[str]):
         super().__init__(server_address, password)
@@ -49,17 +68,57 @@ class ALBWClientContext(CommonContext):
         self.server_connected = False
         self.slot_data = None
         self.course_flags = []
+        self.course = -1
+        self.stage = -1
+        self.flags_save_ptr = 0
+        self.next_course = 0
         self.ravio_scouted = False
         self.citra = CitraInterface()
+        self.metrics = ClientMetrics()
+        self.tracker = None
+        self.patch_task = None
+        self.tracker_task = None
+        self.tracker_update_task = None
         self.invalid = False
         self.last_error = ""
         self.show_citra_connect_message = True
 
+    async def shutdown(self) -> None:
+        # background tasks are stopped here rather than left to asyncio.run's teardown
+        tasks = [task for task in (self.patch_task, self.tracker_task, self.tracker_update_task) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await super().shutdown()
+
     def run_gui(self) -> None:
         from kvui import GameManager
+        from kivy.uix.label import Label
+        from kivy.uix.scrollview import ScrollView
+        from kivy.uix.tabbedpanel import TabbedPanelItem
 
         class ALBWManager(GameManager):
             base_title: str = "Archipelago A Link Between Worlds Client"
+            tracker_text: str = "Open a patch file to enable the tracker."
+            tracker_label: Optional[Label] = None
+
+            def build(self):
+                container = super().build()
+                self.tracker_label = Label(text=self.tracker_text,
+                    size_hint_y=None, halign="left", valign="top")
+                self.tracker_label.bind(width=lambda label, width: setattr(label, "text_size", (width, None)))
+                self.tracker_label.bind(texture_size=lambda label, size: setattr(label, "height", size[1]))
+                scroll = ScrollView()
+                scroll.add_widget(self.tracker_label)
+                tracker_tab = TabbedPanelItem(text="Tracker")
+                tracker_tab.content = scroll
+                self.tabs.add_widget(tracker_tab)
+                return container
+
+            def update_tracker(self, locations: List[str]) -> None:
+                self.tracker_text = f"In logic ({len(locations)}):\n" + "\n".join(locations)
+                if self.tracker_label is not None:
+                    self.tracker_label.text = self.tracker_text
 
         self.ui = ALBWManager(self)
         self.ui_task = asyncio.create_task(self.ui.async_run(), name="UI")
@@ -76,6 +135,7 @@ class ALBWClientContext(CommonContext):
         self.show_citra_connect_message = False
         self.citra_connected = False
         if self.citra.connect():
+            self.course_flags = []
             await asyncio.sleep(1)
             self.citra_connected = True
             if self.server_connected:
@@ -132,6 +192,10 @@ class ALBWClientContext(CommonContext):
         if cmd == "Connected":
             self.slot_data = args["slot_data"]
             self.server_connected = True
+        elif cmd == "RoomUpdate" and "checked_locations" in args:
+            self.metrics.locations_acknowledged(args["checked_locations"])
+        elif cmd == "ReceivedItems":
+            self.metrics.items_received(args["index"], len(args["items"]))
         
     def get_pointers(self) -> bool:
         self.event_flags_ptr = self.citra.read_u32(self.EVENTS_LOCATION)
@@ -141,6 +205,23 @@ class ALBWClientContext(CommonContext):
             return False
         return True
 
+    def read_scene(self) -> bool:
+        course, stage = -1, -1
+        game_ptr = self.citra.read_u32(self.GAME_LOCATION)
+        if game_ptr != 0:
+            course = self.citra.read_u32(game_ptr + self.GAME_COURSE_OFFSET)
+            stage = self.citra.read_u32(game_ptr + self.GAME_STAGE_OFFSET)
+        changed = course != self.course or stage != self.stage
+        self.course = course
+        self.stage = stage
+        return changed
+
+    def read_course_flags(self, course: int) -> bytes:
+        cur_course_flags = self.citra.read(self.course_flags_ptr + course * 0x16c + 0x160, 0x20) \
+                         + self.citra.read(self.course_flags_ptr + course * 0x16c + 0x1a0, 0x10)
+        save_course_flags = self.citra.read(self.save_ptr + 0x560 + course * 0x40, 0x40)
+        return bytes_or(cur_course_flags, save_course_flags)
+
     def read_flags(self) -> None:
         cur_event_flags = self.citra.read(self.event_flags_ptr + 0x48, 0x80)
         save_event_flags = self.citra.read(self.save_ptr + 0x40, 0x80)
@@ -150,12 +231,21 @@ class ALBWClientContext(CommonContext):
         save_minigame_flags = self.citra.read(self.save_ptr + 0xda5, 1)[0]
         self.minigame_flags = cur_minigame_flags | save_minigame_flags
 
-        self.course_flags.clear()
-        for course in range(0, 0x20):
-            cur_course_flags = self.citra.read(self.course_flags_ptr + course * 0x16c + 0x160, 0x20) \
-                             + self.citra.read(self.course_flags_ptr + course * 0x16c + 0x1a0, 0x10)
-            save_course_flags = self.citra.read(self.save_ptr + 0x560 + course * 0x40, 0x40)
-            self.course_flags.append(bytes_or(cur_course_flags, save_course_flags))
+        # Only the current course's flags change at a meaningful rate, so read it every tick and refresh the
+        # others round-robin. Everything is re-read on a scene change, a new save, or an unknown course.
+        scene_changed = self.read_scene()
+        if scene_changed or self.save_ptr != self.flags_save_ptr or len(self.course_flags) != self.COURSE_COUNT \
+                or not 0 <= self.course < self.COURSE_COUNT:
+            self.course_flags = [self.read_course_flags(course) for course in range(self.COURSE_COUNT)]
+            self.flags_save_ptr = self.save_ptr
+            return
+
+        self.course_flags[self.course] = self.read_course_flags(self.course)
+        for _ in range(self.COURSES_PER_TICK):
+            self.next_course = (self.next_course + 1) % self.COURSE_COUNT
+            if self.next_course == self.course:
+                self.next_course = (self.next_course + 1) % self.COURSE_COUNT
+            self.course_flags[self.next_course] = self.read_course_flags(self.next_course)
 
     def check_flag(self, course: Optional[int], flag: int) -> bool:
         byte = flag >> 3
@@ -187,6 +277,7 @@ class ALBWClientContext(CommonContext):
             if self.check_location(loc):
                 code = loc.code + albw_base_id
                 if code not in self.locations_checked:
+                    self.metrics.location_checked(code)
                     self.locations_checked.add(code)
                     checks.append(code)
 
@@ -195,6 +286,7 @@ class ALBWClientContext(CommonContext):
                 "cmd": "LocationChecks",
                 "locations": checks,
             }])
+            self.metrics.locations_sent(checks)
 
         if self.check_flag(None, 685):
             await self.send_msgs([{
@@ -211,17 +303,38 @@ class ALBWClientContext(CommonContext):
             }])
             self.ravio_scouted = True
 
-    def get_item(self) -> None:
+    def update_tracker(self) -> None:
+        # an update asks the randomizer about every pending location, so it runs in a thread, one at a time;
+        # anything received in the meantime is picked up on a later tick
+        if self.tracker is None or (self.tracker_update_task is not None and not self.tracker_update_task.done()):
+            return
+        self.tracker_update_task = asyncio.create_task(self.run_tracker_update(self.tracker), name="UpdateTracker")
+
+    async def run_tracker_update(self, tracker: ALBWTracker) -> None:
+        try:
+            changed = await asyncio.to_thread(tracker.update, list(self.items_received), set(self.locations_checked))
+        except Exception as e:
+            logger.error(f"Could not update the tracker: {e}")
+            return
+        if changed and self.ui is not None:
+            self.ui.update_tracker(tracker.get_in_logic_unchecked())
+
+    def get_item(self) -> int:
         received_items_count = self.citra.read_u32(self.AP_HEADER_LOCATION + 0x50)
         current_item = self.citra.read_u32(self.AP_HEADER_LOCATION + 0xc)
+        self.metrics.items_consumed(received_items_count)
         if len(self.items_received) > received_items_count and current_item == 0xffffffff:
             item_code = self.items_received[received_items_count].item - albw_base_id
             item_id = item_code_table[item_code].progress[0].item_id()
             assert item_id is not None
             self.citra.write_u32(self.AP_HEADER_LOCATION + 0xc, item_id)
+            self.metrics.item_written(received_items_count)
+        return max(len(self.items_received) - received_items_count, 0)
 
 async def game_watcher(ctx: ALBWClientContext) -> None:
     while not ctx.exit_event.is_set():
+        tick_start = time.perf_counter()
+        delivery_backlog = 0
         try:
             ctx.invalid = False
             if not ctx.citra_connected:
@@ -234,7 +347,8 @@ async def game_watcher(ctx: ALBWClientContext) -> None:
                     ctx.validate_save()
                 if not ctx.invalid and ctx.get_pointers() and ctx.server_connected:
                     await ctx.check_locations()
-                    ctx.get_item()
+                    delivery_backlog = ctx.get_item()
+                    ctx.update_tracker()
         except CitraException as e:
             logger.error(e)
             ctx.citra_connected = False
@@ -247,18 +361,82 @@ async def game_watcher(ctx: ALBWClientContext) -> None:
             ctx.server_connected = False
             ctx.last_error = ""
             ctx.show_citra_connect_message = True
+        ctx.metrics.tick(time.perf_counter() - tick_start, delivery_backlog)
         await asyncio.sleep(0.25)
 
+def run_patch(patch_file: str, progress: "multiprocessing.Queue") -> None:
+    # Runs in the patch process, sending each stage and then the result back through the queue
+    ALBWPatch.progress_handler = lambda stage: progress.put(("stage", stage))
+    try:
+        _, output_path = create_rom_file(patch_file)
+        progress.put(("done", output_path))
+    except Exception as e:
+        progress.put(("error", str(e)))
+
+async def patch_game(ctx: ALBWClientContext, patch_file: str) -> None:
+    # Patching takes a while, so run it in a separate process while the client connects to the server and emulator
+    logger.info("Patching the game in the background. You can connect in the meantime.")
+    start = time.perf_counter()
+    exit_time: Optional[float] = None
+    # spawned rather than forked, since the client already runs the GUI, the event loop and executor threads
+    context = multiprocessing.get_context("spawn")
+    progress = context.Queue()
+    process = context.Process(target=run_patch, args=(patch_file, progress), daemon=True)
+    process.start()
+    try:
+        while not ctx.exit_event.is_set():
+            try:
+                kind, message = progress.get_nowait()
+            except queue.Empty:
+                if process.is_alive():
+                    await asyncio.sleep(0.25)
+                    continue
+                # the process may have exited just after sending its result, so wait a moment for it to arrive
+                if exit_time is None:
+                    exit_time = time.perf_counter()
+                if time.perf_counter() - exit_time < 1:
+                    await asyncio.sleep(0.1)
+                    continue
+                logger.error(f"Patching failed: the patch process exited with code {process.exitcode}")
+                return
+            elapsed = time.perf_counter() - start
+            if kind == "stage":
+                logger.info(f"Patching: {message}... ({elapsed:.0f}s elapsed)")
+            elif kind == "done":
+                logger.info(f"Patching finished in {elapsed:.0f}s. Output written to {message}")
+                return
+            else:
+                logger.error(f"Patching failed: {message}")
+                return
+    finally:
+        # closing the client mid-patch stops the patch rather than waiting for it
+        if process.is_alive():
+            process.terminate()
+            await asyncio.to_thread(process.join)
+            # the output is written to a temporary file next to the patch and only renamed into place when done
+            temp_target = os.path.splitext(patch_file)[0] + ALBWProcedurePatch.result_file_ending + ".tmp"
+            if os.path.exists(temp_target):
+                os.remove(temp_target)
+
+async def load_tracker(ctx: ALBWClientContext, patch_file: str) -> None:
+    try:
+        patch_info = load_patch_info(patch_file)
+        ctx.tracker = await asyncio.to_thread(ALBWTracker, patch_info, albw_base_id)
+    except Exception as e:
+        logger.error(f"Could not load the tracker: {e}")
+
 def launch() -> None:
     async def main():
         parser = get_base_parser()
         parser.add_argument("patch_file", default="", type=str, nargs="?", help="Path to an Archipelago patch file")
+        parser.add_argument("--metrics_port", default=0, type=int,
+            help="Serve latency metrics in the Prometheus text format on this localhost port")
         args = parser.parse_args()
 
-        if args.patch_file != "":
-            create_rom_file(args.patch_file)
-
         ctx = ALBWClientContext(args.connect, args.password)
+        if args.metrics_port:
+            await ctx.metrics.serve(args.metrics_port)
+            logger.info(f"Serving metrics at http://127.0.0.1:{args.metrics_port}/metrics")
         ctx.server_task = asyncio.create_task(server_loop(ctx), name="ServerLoop")
 
         if gui_enabled:
@@ -267,12 +445,17 @@ def launch() -> None:
 
         watcher_task = asyncio.create_task(game_watcher(ctx), name="GameWatcher")
 
+        if args.patch_file != "":
+            ctx.patch_task = asyncio.create_task(patch_game(ctx, args.patch_file), name="PatchGame")
+            ctx.tracker_task = asyncio.create_task(load_tracker(ctx, args.patch_file), name="LoadTracker")
+
         try:
             await watcher_task
         except Exception as e:
             logger.error("".join(traceback.format_exception(e)))
 
         await ctx.exit_event.wait()
+        ctx.metrics.close()
         await ctx.shutdown()
 
     import colorama
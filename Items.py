@@ -1,7 +1,7 @@
 from typing import Dict, List, Optional
 from enum import Enum
 from BaseClasses import Item, ItemClassification
-from .Options import ALBWOptions, LogicMode
+from .Options import ALBWOptions, CrackShuffle, LogicMode, WeatherVanes
 from albwrandomizer import PyRandomizable, Item as RItem, Goal, Vane, new_item, new_goal, new_vane
 
 class ALBWItem(Item):
@@ -418,4 +418,16 @@ convenient_lorule_vanes: List[ItemData] = [
     Items.VacantHouseWV,
 ]
 
+def get_starting_vanes(options: ALBWOptions) -> List[ItemData]:
+    starting_vanes = []
+    if options.weather_vanes in [WeatherVanes.option_hyrule, WeatherVanes.option_all]:
+        starting_vanes += hyrule_vanes
+    if options.weather_vanes in [WeatherVanes.option_lorule, WeatherVanes.option_all]:
+        starting_vanes += lorule_vanes
+    if options.weather_vanes == WeatherVanes.option_convenient:
+        starting_vanes += convenient_hyrule_vanes
+        if not options.crack_shuffle == CrackShuffle.option_off:
+            starting_vanes += convenient_lorule_vanes
+    return starting_vanes
+
 APItem = new_item(RItem.LetterInABottle)
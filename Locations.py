@@ -1,4 +1,4 @@
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 from enum import Enum
 from BaseClasses import Location
 from .Items import ItemData, Items
@@ -598,10 +598,10 @@ dungeon_table: List[Dungeon] = [
 ]
 
 # Locations that cannot have dungeon items because they are outside the dungeon they are associated with
-dungeon_item_excludes: List[str] = [
+dungeon_item_excludes: Set[str] = {
     "[SW] Outdoor Chest",
     "[TT] Stalblind",
     "[DP] Zaganaga",
     "[TR] Left Balcony",
     "[LC] Zelda",
-]
+}
@@ -0,0 +1,165 @@
+from typing import TYPE_CHECKING, Callable, DefaultDict, Dict, List, Optional, Tuple, Union
+from collections import OrderedDict, defaultdict
+import threading
+from BaseClasses import CollectionState, MultiWorld
+from ..AutoWorld import LogicMixin
+from .Locations import location_table
+from albwrandomizer import PyRandomizable
+
+if TYPE_CHECKING:
+    from . import ALBWWorld
+
+# a location name for can_reach, or a (source, target) region pair for can_traverse
+RuleKey = Union[str, Tuple[str, str]]
+Fingerprint = Tuple[Tuple[str, int], ...]
+
+class RegionSkeleton:
+    """The seed-independent part of the randomizer's region graph, converted to AP names."""
+    regions: List[Tuple[str, List[str]]]
+    edges: List[Tuple[str, str, str]]
+
+    def __init__(self, region_graph: Dict[str, Tuple[List[str], List[str]]]):
+        self.regions = []
+        self.edges = []
+        for (region_name, (locations, _)) in region_graph.items():
+            # skip locations like hint ghosts without AP counterparts
+            self.regions.append((region_name, [name for name in locations if name in location_table]))
+
+        path_counts: Dict[str, int] = {}
+        for (source_region_name, (_, paths)) in region_graph.items():
+            for target_region_name in paths:
+                name = f"{source_region_name} -> {target_region_name}"
+                if name in path_counts.keys():
+                    path_counts[name] += 1
+                    name = f"{name} [{path_counts[name]}]"
+                else:
+                    path_counts[name] = 1
+                self.edges.append((source_region_name, target_region_name, name))
+
+class ReachabilitySnapshot:
+    results: Dict[RuleKey, bool]
+    fingerprint_id: Optional[int]
+
+    def __init__(self):
+        self.results = {}
+        self.fingerprint_id = None
+
+class RuleCache:
+    """LRU cache of rule results by progression fingerprint. Safe to share between threads, since AP evaluates
+    rules in the accessibility check while outputs are being generated."""
+    maxsize: int
+    entries: "OrderedDict[Tuple[RuleKey, int], bool]"
+    fingerprints: "OrderedDict[Fingerprint, int]"
+    next_fingerprint_id: int
+    hits: int
+    misses: int
+    lock: threading.Lock
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.fingerprints = OrderedDict()
+        self.next_fingerprint_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get_fingerprint_id(self, fingerprint: Fingerprint) -> int:
+        # evicted fingerprints get a fresh id, so their stale entries can never be hit again
+        with self.lock:
+            if fingerprint in self.fingerprints:
+                self.fingerprints.move_to_end(fingerprint)
+                return self.fingerprints[fingerprint]
+            fingerprint_id = self.next_fingerprint_id
+            self.next_fingerprint_id += 1
+            self.fingerprints[fingerprint] = fingerprint_id
+            if len(self.fingerprints) > self.maxsize:
+                self.fingerprints.popitem(last=False)
+            return fingerprint_id
+
+    def get(self, key: Tuple[RuleKey, int]) -> Optional[bool]:
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Tuple[RuleKey, int], value: bool) -> None:
+        with self.lock:
+            self.entries[key] = value
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.fingerprints.clear()
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+def minimize_requirements(counts: Dict[str, int], is_sufficient: Callable[[Dict[str, int]], bool]) -> Dict[str, int]:
+    """Greedily lowers item counts while is_sufficient holds, until no single item can be given up."""
+    required = dict(counts)
+    for name in sorted(counts):
+        count = required.pop(name)
+        if is_sufficient(required):
+            continue
+        while count > 1:
+            required[name] = count - 1
+            if not is_sufficient(required):
+                break
+            count -= 1
+        required[name] = count
+    return required
+
+# Rules are slotted objects rather than closures so that each holds only a reference to the shared world
+# and its own names
+
+class LocationRule:
+    __slots__ = ("world", "location_name")
+
+    world: "ALBWWorld"
+    location_name: str
+
+    def __init__(self, world: "ALBWWorld", location_name: str):
+        self.world = world
+        self.location_name = location_name
+
+    def __call__(self, state: CollectionState) -> bool:
+        return self.world._can_reach(state, self.location_name)
+
+class EntranceRule:
+    __slots__ = ("world", "source_region_name", "target_region_name")
+
+    world: "ALBWWorld"
+    source_region_name: str
+    target_region_name: str
+
+    def __init__(self, world: "ALBWWorld", source_region_name: str, target_region_name: str):
+        self.world = world
+        self.source_region_name = source_region_name
+        self.target_region_name = target_region_name
+
+    def __call__(self, state: CollectionState) -> bool:
+        return self.world._can_traverse(state, self.source_region_name, self.target_region_name)
+
+class ALBWLogic(LogicMixin):
+    # randomizer view of each ALBW player's progression items, kept in sync by ALBWWorld.collect and remove
+    albw_randomizables: DefaultDict[int, List[PyRandomizable]]
+    # rule results for the current progression; copies share each snapshot,
+    # and it is replaced rather than cleared when progression changes
+    albw_reachability: DefaultDict[int, ReachabilitySnapshot]
+
+    def init_mixin(self, multiworld: MultiWorld) -> None:
+        self.albw_randomizables = defaultdict(list)
+        self.albw_reachability = defaultdict(ReachabilitySnapshot)
+
+    def copy_mixin(self, new_state: CollectionState) -> CollectionState:
+        new_state.albw_randomizables = defaultdict(list,
+            {player: randomizables.copy() for player, randomizables in self.albw_randomizables.items()})
+        new_state.albw_reachability = defaultdict(ReachabilitySnapshot, self.albw_reachability)
+        return new_state
@@ -0,0 +1,158 @@
+from typing import Dict, Iterable, List, Optional, Sequence
+import asyncio
+import time
+
+class Histogram:
+    buckets: Sequence[float]
+    counts: List[int]
+    total: float
+    count: int
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+    def render(self, name: str, description: str) -> List[str]:
+        lines = [f"# HELP {name} {description}", f"# TYPE {name} histogram"]
+        for bound, count in zip(self.buckets, self.counts):
+            lines.append(f'{name}_bucket{{le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum {self.total}")
+        lines.append(f"{name}_count {self.count}")
+        return lines
+
+class ClientMetrics:
+    """Timestamps each stage of check and item delivery and renders the results in the Prometheus text format.
+
+    Locations: flag seen by read_flags -> LocationChecks sent -> acknowledged by the server.
+    Items: received from the server -> written to the game -> consumed by the game.
+    The moment a flag is set in game cannot be observed directly; it lies within the tick before it is seen."""
+    LATENCY_BUCKETS: Sequence[float] = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+    TICK_BUCKETS: Sequence[float] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+    location_seen_at: Dict[int, float]
+    location_sent_at: Dict[int, float]
+    item_received_at: Dict[int, float]
+    item_written_at: Dict[int, float]
+    histograms: Dict[str, Histogram]
+    descriptions: Dict[str, str]
+    delivery_backlog: int
+    ticks: int
+    server: Optional[asyncio.AbstractServer]
+
+    def __init__(self):
+        self.location_seen_at = {}
+        self.location_sent_at = {}
+        self.item_received_at = {}
+        self.item_written_at = {}
+        self.histograms = {}
+        self.descriptions = {}
+        self.delivery_backlog = 0
+        self.ticks = 0
+        self.server = None
+        self._add_histogram("albw_check_send_seconds", "Time from a location flag being seen to LocationChecks being sent.")
+        self._add_histogram("albw_check_ack_seconds", "Time from LocationChecks being sent to the server acknowledging it.")
+        self._add_histogram("albw_check_total_seconds", "Time from a location flag being seen to the server acknowledging it.")
+        self._add_histogram("albw_item_write_seconds", "Time from an item being received to it being written to the game.")
+        self._add_histogram("albw_item_consume_seconds", "Time from an item being written to the game consuming it.")
+        self._add_histogram("albw_item_total_seconds", "Time from an item being received to the game consuming it.")
+        self._add_histogram("albw_tick_seconds", "Duration of one game watcher tick.", self.TICK_BUCKETS)
+
+    def _add_histogram(self, name: str, description: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.histograms[name] = Histogram(buckets)
+        self.descriptions[name] = description
+
+    def location_checked(self, code: int) -> None:
+        self.location_seen_at.setdefault(code, time.perf_counter())
+
+    def locations_sent(self, codes: Iterable[int]) -> None:
+        now = time.perf_counter()
+        for code in codes:
+            self.location_sent_at[code] = now
+            if code in self.location_seen_at:
+                self.histograms["albw_check_send_seconds"].observe(now - self.location_seen_at[code])
+
+    def locations_acknowledged(self, codes: Iterable[int]) -> None:
+        now = time.perf_counter()
+        for code in codes:
+            sent = self.location_sent_at.pop(code, None)
+            seen = self.location_seen_at.pop(code, None)
+            if sent is not None:
+                self.histograms["albw_check_ack_seconds"].observe(now - sent)
+            if seen is not None:
+                self.histograms["albw_check_total_seconds"].observe(now - seen)
+
+    def items_received(self, start: int, count: int) -> None:
+        now = time.perf_counter()
+        for index in range(start, start + count):
+            self.item_received_at.setdefault(index, now)
+
+    def item_written(self, index: int) -> None:
+        now = time.perf_counter()
+        if index in self.item_written_at:
+            return
+        self.item_written_at[index] = now
+        if index in self.item_received_at:
+            self.histograms["albw_item_write_seconds"].observe(now - self.item_received_at[index])
+
+    def items_consumed(self, count: int) -> None:
+        now = time.perf_counter()
+        for index in [index for index in self.item_received_at if index < count]:
+            received = self.item_received_at.pop(index)
+            written = self.item_written_at.pop(index, None)
+            # items consumed before this session (e.g. on a resync) were never written by us
+            if written is not None:
+                self.histograms["albw_item_consume_seconds"].observe(now - written)
+                self.histograms["albw_item_total_seconds"].observe(now - received)
+
+    def tick(self, duration: float, delivery_backlog: int) -> None:
+        self.histograms["albw_tick_seconds"].observe(duration)
+        self.delivery_backlog = delivery_backlog
+        self.ticks += 1
+
+    def render(self) -> str:
+        lines = []
+        for name, histogram in self.histograms.items():
+            lines.extend(histogram.render(name, self.descriptions[name]))
+        lines.extend([
+            "# HELP albw_delivery_backlog Items received from the server but not yet consumed by the game.",
+            "# TYPE albw_delivery_backlog gauge",
+            f"albw_delivery_backlog {self.delivery_backlog}",
+            "# HELP albw_checks_pending Checks sent to the server but not yet acknowledged.",
+            "# TYPE albw_checks_pending gauge",
+            f"albw_checks_pending {len(self.location_sent_at)}",
+            "# HELP albw_ticks_total Game watcher ticks completed.",
+            "# TYPE albw_ticks_total counter",
+            f"albw_ticks_total {self.ticks}",
+        ])
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, port: int) -> None:
+        self.server = await asyncio.start_server(self._handle_request, "127.0.0.1", port)
+
+    async def _handle_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while (await reader.readline()).strip():
+                pass
+            body = self.render().encode("utf-8")
+            writer.write(b"HTTP/1.0 200 OK\r\n"
+                + b"Content-Type: text/plain; version=0.0.4\r\n"
+                + f"Content-Length: {len(body)}\r\n\r\n".encode("utf-8")
+                + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            self.server = None
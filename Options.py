@@ -1,4 +1,5 @@
-from dataclasses import dataclass
+from typing import List
+from dataclasses import dataclass, fields
 from Options import PerGameCommonOptions, Choice, Range, Toggle
 import albwrandomizer
 
@@ -194,6 +195,10 @@ class ALBWOptions(PerGameCommonOptions):
     purple_potion_bottles: PurplePotionBottles
     keysy: Keysy
 
+# ALBW's own options, exported in slot data so trackers can rebuild the randomizer settings
+slot_data_options: List[str] = [field.name for field in fields(ALBWOptions)
+    if field.name not in {common_field.name for common_field in fields(PerGameCommonOptions)}]
+
 def create_randomizer_settings(options: ALBWOptions) -> albwrandomizer.Settings:
     settings = albwrandomizer.Settings()
 
@@ -1,42 +1,55 @@
+import hashlib
+import io
+import logging
 import os
-import pickle
-import shutil
 import tempfile
-from typing import ClassVar, Dict, Optional
+import time
+from types import SimpleNamespace
+from typing import BinaryIO, Callable, Dict, Optional, cast
 from worlds.Files import APProcedurePatch, AutoPatchExtensionRegister
 from Patch import create_rom_file
-from Utils import Version
 from settings import get_settings
-from .Items import item_table, APItem
-from .Options import ALBWOptions, create_randomizer_settings
-from albwrandomizer import ArchipelagoInfo, logging_on, randomize_pre_fill
-
-class PatchInfo:
-    version: Version
-    seed: int
-    player_name: str
-    options: ALBWOptions
-    check_map: Dict[str, str]
-    item_names: Dict[str, str]
-
-    version: ClassVar[Version] = Version(0, 1, 0)
-    min_compatible_version: ClassVar[Version] = Version(0, 1, 0)
-
-    def __init__(
-        self,
-        version: Version,
-        seed: int,
-        player_name: str,
-        options: ALBWOptions,
-        check_map: Dict[str, str],
-        item_names: Dict[str, str],
-    ):
-        self.version = version
-        self.seed = seed
-        self.player_name = player_name
-        self.options = options
-        self.check_map = check_map
-        self.item_names = item_names
+from .Archive import check_level, write_zip
+from .Cache import DiskCache, get_library_version, make_key
+from .Items import all_items, item_table, APItem
+from .Locations import all_locations
+from .Options import ALBWOptions, create_randomizer_settings, slot_data_options
+from .PatchFormat import PatchInfo, read_patch_info
+from .Profiling import get_peak_rss, profiler
+from .Rom import get_rom_fingerprint, validate_rom
+from albwrandomizer import ArchipelagoInfo, SeedInfo, logging_on, randomize_pre_fill
+
+# called with the name of each patching stage as it starts, e.g. to show progress in the client
+progress_handler: Optional[Callable[[str], None]] = None
+
+def report_progress(stage: str) -> None:
+    logging.debug(f"ALBW patching: {stage}")
+    if progress_handler is not None:
+        progress_handler(stage)
+
+location_codes: Dict[str, int] = {loc.name: loc.code for loc in all_locations if loc.code is not None}
+item_codes: Dict[str, int] = {item.name: item.code for item in all_items if item.code is not None}
+
+def read_options(values: Dict[str, int]) -> ALBWOptions:
+    # only ALBW's own options are stored, so they are restored as a namespace rather than the full dataclass;
+    # options missing from older patches keep their defaults
+    type_hints = ALBWOptions.type_hints
+    return cast(ALBWOptions, SimpleNamespace(**{name: type_hints[name].from_any(values.get(name,
+        type_hints[name].default)) for name in slot_data_options}))
+
+def load_patch_info(patch_file: str) -> PatchInfo:
+    patch = ALBWProcedurePatch(patch_file)
+    patch.read()
+    return read_patch_info(patch.get_file("patch_info.bin"), location_codes, item_codes)
+
+def build_seed_info(patch_info: PatchInfo) -> SeedInfo:
+    # Load Archipelago info from the patch info
+    archipelago_info = ArchipelagoInfo()
+    archipelago_info.name = patch_info.player_name
+    archipelago_info.item_names = patch_info.item_names
+
+    settings = create_randomizer_settings(read_options(patch_info.options))
+    return profiler.call("randomize_pre_fill", randomize_pre_fill, patch_info.seed, settings, archipelago_info)
 
 class ALBWProcedurePatch(APProcedurePatch):
     game: str = "A Link Between Worlds"
@@ -53,51 +66,85 @@ class ALBWProcedurePatch(APProcedurePatch):
     def get_source_data(cls) -> bytes:
         cls.rom_file = get_settings().albw_settings.rom_file
         logging_on()
+        profiler.reset()
+        profiler.enabled = bool(get_settings().albw_settings.native_profiling)
+        profiler.set_stage("patch")
 
         return b""
 
+    def patch(self, target: str) -> None:
+        # Stream the archive straight to the target rather than returning it from patch_albw as bytes
+        self.read()
+        self.get_source_data_with_cache()
+        albw_settings = get_settings().albw_settings
+        cache = DiskCache("patch", albw_settings.patch_cache_size * 1024 * 1024)
+        temp_target = f"{target}.tmp"
+        try:
+            key = ""
+            if cache.enabled:
+                validate_rom(self.rom_file)
+                key = make_key(hashlib.sha256(self.get_file("patch_info.bin")).hexdigest(),
+                    get_rom_fingerprint(self.rom_file), get_library_version(), albw_settings.patch_compression_level)
+                report_progress("Looking up cached output")
+                if cache.get_file(key, temp_target):
+                    os.replace(temp_target, target)
+                    logging.info("Reused the cached A Link Between Worlds patch output")
+                    return
+
+            with open(temp_target, "wb") as output_file:
+                write_patch(self, "patch_info.bin", output_file)
+            if cache.enabled:
+                try:
+                    cache.put_file(key, temp_target)
+                except OSError as e:
+                    logging.debug(f"Could not write ALBW patch cache entry: {e}")
+            os.replace(temp_target, target)
+        finally:
+            if os.path.exists(temp_target):
+                os.remove(temp_target)
+
+def write_patch(caller: ALBWProcedurePatch, patch_name: str, output_file: BinaryIO) -> None:
+    start = time.perf_counter()
+    # Reject a bad compression level or a wrong or encrypted ROM before any patch work starts
+    albw_settings = get_settings().albw_settings
+    check_level(albw_settings.patch_compression_level)
+    report_progress("Validating ROM")
+    validate_rom(caller.rom_file)
+
+    # Load patch info from the binary file
+    patch_info = read_patch_info(caller.get_file(patch_name), location_codes, item_codes)
+
+    # Initialize seed info from the patch info
+    report_progress("Running pre-fill")
+    seed_info = build_seed_info(patch_info)
+    check_map = {loc_name: item_table[item_name].progress[0] if item_name != "AP Item" else APItem
+        for loc_name, item_name in patch_info.check_map.items()}
+    report_progress("Building layout")
+    profiler.call("build_layout", seed_info.build_layout, check_map)
+
+    with tempfile.TemporaryDirectory() as output_directory:
+        # Create the patch and put it in a zip file
+        report_progress("Patching game files")
+        profiler.call("patch", seed_info.patch, caller.rom_file, output_directory)
+        report_progress("Writing archive")
+        write_zip(output_directory, output_file, albw_settings.patch_compression_level,
+            albw_settings.patch_compression_workers)
+
+    peak_rss = get_peak_rss()
+    logging.info(f"Patched A Link Between Worlds in {time.perf_counter() - start:.1f}s" +
+        (f", peak memory {peak_rss / 2**20:.0f} MiB" if peak_rss is not None else ""))
+    if profiler.enabled:
+        logging.info(f"ALBW native call profile:\n{profiler.report()}")
+
 class ALBWPatchExtension(metaclass=AutoPatchExtensionRegister):
     game: str = "A Link Between Worlds"
 
     @staticmethod
     def patch_albw(caller: ALBWProcedurePatch, rom: bytes, patch_name: str) -> bytes:
-        # Load patch info from the binary file
-        patch_info = pickle.loads(caller.get_file(patch_name))
-
-        # Check patch version
-        if patch_info.version > PatchInfo.version:
-            raise Exception(f"The patch file was generated on a newer version of the apworld. \
-                Please update to version {patch_info.version.as_simple_string()}.")
-        elif patch_info.version < PatchInfo.min_compatible_version:
-            raise Exception(f"The patch file was generated on an older version of the apworld. \
-                For compatibility, you must downgrade to version {patch_info.version.as_simple_string()}.")
-
-        # Load Archipelago info from the patch info
-        archipelago_info = ArchipelagoInfo()
-        archipelago_info.name = patch_info.player_name
-        archipelago_info.item_names = patch_info.item_names
-
-        # Initialize seed info from the patch info
-        settings = create_randomizer_settings(patch_info.options)
-        seed_info = randomize_pre_fill(patch_info.seed, settings, archipelago_info)
-        check_map = {loc_name: item_table[item_name].progress[0] if item_name != "AP Item" else APItem
-            for loc_name, item_name in patch_info.check_map.items()}
-        seed_info.build_layout(check_map)
-
-        with tempfile.TemporaryDirectory() as output_directory:
-            # Create the patch
-            output_subdirectory = os.path.join(output_directory, f"tmp_apalbw_{caller.player}")
-            os.mkdir(output_subdirectory)
-            seed_info.patch(caller.rom_file, output_subdirectory)
-
-            # Put the patch in a zip file
-            output_path = os.path.join(output_directory, f"tmp_apalbw_{caller.player}.zip")
-            shutil.make_archive(output_subdirectory, "zip", output_subdirectory)
-
-            # Output the contents of the zip file
-            with open(output_path, "rb") as output_file:
-                output = output_file.read()
-            return output
+        # only used when the procedure is run step by step; ALBWProcedurePatch.patch streams to disk instead
+        output = io.BytesIO()
+        write_patch(caller, patch_name, output)
+        return output.getvalue()
 
 if __name__ == "__main__":
     create_rom_file(sys.argv[1])
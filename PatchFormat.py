@@ -0,0 +1,94 @@
+import json
+import struct
+import zlib
+from typing import ClassVar, Dict, Union
+from Utils import Version
+
+# Patch info is stored as this magic, the version as three shorts, and zlib compressed JSON. Locations and items
+# are referred to by their AP code, which stays stable between versions, or by name when they have none.
+# This module only depends on Utils, so patch info can be read and written without loading the randomizer.
+PATCH_INFO_MAGIC: bytes = b"ALBWPI"
+PATCH_INFO_VERSION: struct.Struct = struct.Struct("<3H")
+AP_ITEM_CODE: int = -1
+
+class PatchInfo:
+    version: Version
+    seed: int
+    player_name: str
+    options: Dict[str, int]
+    check_map: Dict[str, str]
+    item_names: Dict[str, str]
+
+    version: ClassVar[Version] = Version(0, 2, 0)
+    min_compatible_version: ClassVar[Version] = Version(0, 2, 0)
+
+    def __init__(
+        self,
+        version: Version,
+        seed: int,
+        player_name: str,
+        options: Dict[str, int],
+        check_map: Dict[str, str],
+        item_names: Dict[str, str],
+    ):
+        self.version = version
+        self.seed = seed
+        self.player_name = player_name
+        self.options = options
+        self.check_map = check_map
+        self.item_names = item_names
+
+def write_patch_info(patch_info: PatchInfo, location_codes: Dict[str, int], item_codes: Dict[str, int]) -> bytes:
+    names: Dict[str, int] = {}
+
+    def location_ref(name: str) -> Union[int, str]:
+        # events and a few check map locations, like inaccessible shop slots, have no code
+        return location_codes.get(name, name)
+
+    def item_ref(name: str) -> Union[int, str]:
+        return AP_ITEM_CODE if name == "AP Item" else item_codes.get(name, name)
+
+    payload = {
+        "seed": patch_info.seed,
+        "player_name": patch_info.player_name,
+        "options": patch_info.options,
+        "check_map": [[location_ref(loc_name), item_ref(item_name)]
+            for loc_name, item_name in patch_info.check_map.items()],
+        "item_names": [[location_ref(loc_name), names.setdefault(item_name, len(names))]
+            for loc_name, item_name in patch_info.item_names.items()],
+        "names": list(names),
+    }
+    return PATCH_INFO_MAGIC + PATCH_INFO_VERSION.pack(*patch_info.version[:3]) \
+        + zlib.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"), 9)
+
+def check_patch_version(version: Version) -> None:
+    if version > PatchInfo.version:
+        raise Exception(f"The patch file was generated on a newer version of the apworld. \
+            Please update to version {version.as_simple_string()}.")
+    elif version < PatchInfo.min_compatible_version:
+        raise Exception(f"The patch file was generated on an older version of the apworld. \
+            For compatibility, you must downgrade to version {version.as_simple_string()}.")
+
+def read_patch_info(data: bytes, location_codes: Dict[str, int], item_codes: Dict[str, int]) -> PatchInfo:
+    if not data.startswith(PATCH_INFO_MAGIC):
+        # patches from before version 0.2.0 hold a pickle, which is never loaded since it can run arbitrary code
+        raise Exception(f"The patch file was generated on an older version of the apworld. \
+            For compatibility, you must downgrade to a version before {PatchInfo.min_compatible_version.as_simple_string()}.")
+
+    version = Version(*PATCH_INFO_VERSION.unpack_from(data, len(PATCH_INFO_MAGIC)))
+    check_patch_version(version)
+    payload = json.loads(zlib.decompress(data[len(PATCH_INFO_MAGIC) + PATCH_INFO_VERSION.size:]))
+    location_names = {code: name for name, code in location_codes.items()}
+    item_names = {code: name for name, code in item_codes.items()}
+    item_names[AP_ITEM_CODE] = "AP Item"
+
+    def location_name(ref: Union[int, str]) -> str:
+        return location_names[ref] if isinstance(ref, int) else ref
+
+    def item_name(ref: Union[int, str]) -> str:
+        return item_names[ref] if isinstance(ref, int) else ref
+
+    names = payload["names"]
+    return PatchInfo(version, payload["seed"], payload["player_name"], payload["options"],
+        {location_name(loc_ref): item_name(item_ref) for loc_ref, item_ref in payload["check_map"]},
+        {location_name(loc_ref): names[name_index] for loc_ref, name_index in payload["item_names"]})
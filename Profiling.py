@@ -0,0 +1,90 @@
+from typing import Callable, Dict, Iterator, Optional, Tuple, TypeVar
+from contextlib import contextmanager
+import sys
+import threading
+import time
+
+T = TypeVar("T")
+
+class CallStats:
+    count: int
+    total: float
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+
+class NativeProfiler:
+    """Optional call counters and cumulative timers for ALBW logic and randomizer calls, grouped by world stage.
+    The stage is kept per thread, since AP runs output, slot data and accessibility checks on a thread pool."""
+    enabled: bool
+    stages: threading.local
+    stats: Dict[Tuple[str, str], CallStats]
+    lock: threading.Lock
+
+    def __init__(self):
+        self.enabled = False
+        self.stages = threading.local()
+        self.stats = {}
+        self.lock = threading.Lock()
+        self.set_stage("setup")
+
+    @property
+    def stage(self) -> str:
+        # calls from threads that never entered a stage, like AP's accessibility check, are grouped together
+        return getattr(self.stages, "stage", "other")
+
+    def set_stage(self, stage: str) -> None:
+        self.stages.stage = stage
+
+    @contextmanager
+    def in_stage(self, stage: str) -> Iterator[None]:
+        """Sets the stage for the current thread, and restores the previous one afterwards for pooled threads."""
+        previous = getattr(self.stages, "stage", None)
+        self.stages.stage = stage
+        try:
+            yield
+        finally:
+            if previous is None:
+                del self.stages.stage
+            else:
+                self.stages.stage = previous
+
+    def call(self, name: str, function: Callable[..., T], *args) -> T:
+        if not self.enabled:
+            return function(*args)
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, duration: float) -> None:
+        with self.lock:
+            stats = self.stats.setdefault((self.stage, name), CallStats())
+            stats.count += 1
+            stats.total += duration
+
+    def report(self) -> str:
+        lines = [f"{'stage':<22}{'call':<20}{'count':>10}{'total (s)':>12}{'mean (ms)':>12}"]
+        for (stage, name), stats in self.stats.items():
+            lines.append(f"{stage:<22}{name:<20}{stats.count:>10}{stats.total:>12.3f}"
+                f"{stats.total / stats.count * 1000:>12.3f}")
+        return "\n".join(lines)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.stats.clear()
+        self.stages = threading.local()
+        self.set_stage("setup")
+
+profiler = NativeProfiler()
+
+def get_peak_rss() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in bytes on macOS and in kilobytes elsewhere
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
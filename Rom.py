@@ -0,0 +1,110 @@
+from typing import Dict, List, Optional, Union
+import concurrent.futures
+import hashlib
+import json
+import logging
+import mmap
+import os
+import tempfile
+from Utils import cache_path
+
+SAMPLE_SIZE: int = 1 << 16
+SAMPLE_COUNT: int = 64
+TITLE_ID: int = 0x00040000000EC300
+MEDIA_UNIT: int = 0x200
+
+class RomIndex:
+    """Remembers facts about ROM files, keyed by path and only trusted while their size and mtime are unchanged."""
+    path: str
+    entries: Dict[str, Dict[str, object]]
+
+    def __init__(self):
+        self.path = cache_path("albw", "roms.json")
+        try:
+            with open(self.path) as file:
+                self.entries = json.load(file)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, rom_file: str, key: str) -> Optional[object]:
+        entry = self.entries.get(os.path.abspath(rom_file))
+        stat = os.stat(rom_file)
+        if entry is None or entry.get("size") != stat.st_size or entry.get("mtime_ns") != stat.st_mtime_ns:
+            return None
+        return entry.get(key)
+
+    def put(self, rom_file: str, key: str, value: object) -> None:
+        stat = os.stat(rom_file)
+        path = os.path.abspath(rom_file)
+        entry = self.entries.get(path)
+        if entry is None or entry.get("size") != stat.st_size or entry.get("mtime_ns") != stat.st_mtime_ns:
+            entry = self.entries[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        entry[key] = value
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+            with os.fdopen(fd, "w") as file:
+                json.dump(self.entries, file)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logging.debug(f"Could not write ALBW ROM index: {e}")
+
+def get_sample_offsets(size: int) -> List[int]:
+    if size <= SAMPLE_SIZE * SAMPLE_COUNT:
+        return list(range(0, size, SAMPLE_SIZE))
+    step = (size - SAMPLE_SIZE) // (SAMPLE_COUNT - 1)
+    return [i * step for i in range(SAMPLE_COUNT)]
+
+def hash_samples(rom: mmap.mmap, size: int) -> str:
+    # hashlib releases the GIL on large buffers, so samples are hashed in parallel and the digests combined
+    def hash_sample(offset: int) -> bytes:
+        return hashlib.sha256(rom[offset:offset + SAMPLE_SIZE]).digest()
+
+    digest = hashlib.sha256(str(size).encode("utf-8"))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as executor:
+        for sample_digest in executor.map(hash_sample, get_sample_offsets(size)):
+            digest.update(sample_digest)
+    return digest.hexdigest()
+
+def get_rom_fingerprint(rom_file: str) -> str:
+    """A fast fingerprint of the ROM from its size and evenly spaced samples, rather than a hash of every byte."""
+    index = RomIndex()
+    fingerprint = index.get(rom_file, "fingerprint")
+    if isinstance(fingerprint, str):
+        return fingerprint
+    with open(rom_file, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as rom:
+        fingerprint = hash_samples(rom, len(rom))
+    index.put(rom_file, "fingerprint", fingerprint)
+    return fingerprint
+
+def check_rom(rom: Union[mmap.mmap, bytes]) -> Optional[str]:
+    # NCSD header: magic at 0x100, title ID at 0x108, partition table of (offset, size) in media units at 0x120
+    if len(rom) < 0x200 or rom[0x100:0x104] != b"NCSD":
+        return "not a .3ds ROM"
+    if int.from_bytes(rom[0x108:0x110], "little") != TITLE_ID:
+        return "not the North American A Link Between Worlds ROM"
+    partition_offset = int.from_bytes(rom[0x120:0x124], "little") * MEDIA_UNIT
+    partition_size = int.from_bytes(rom[0x124:0x128], "little") * MEDIA_UNIT
+    if partition_offset + partition_size > len(rom) \
+            or rom[partition_offset + 0x100:partition_offset + 0x104] != b"NCCH":
+        return "truncated or corrupted"
+    # the NoCrypto bit of the game partition's NCCH flags is set by decrypted dumps
+    if not rom[partition_offset + 0x18F] & 0x4:
+        return "encrypted; dump it again with decryption enabled"
+    return None
+
+def validate_rom(rom_file: str) -> None:
+    """Checks the ROM's NCSD header, title ID and game partition, raising ValueError for a wrong or encrypted ROM.
+    The verdict is cached by path, size and mtime, along with the ROM's fingerprint."""
+    index = RomIndex()
+    if index.get(rom_file, "valid") is True:
+        return
+    error = index.get(rom_file, "error")
+    if error is None:
+        with open(rom_file, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as rom:
+            error = check_rom(rom)
+            if error is None:
+                index.put(rom_file, "fingerprint", hash_samples(rom, len(rom)))
+        index.put(rom_file, "valid" if error is None else "error", True if error is None else error)
+    if error is not None:
+        raise ValueError(f"{rom_file} is {error}.")
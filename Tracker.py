@@ -0,0 +1,108 @@
+from typing import Dict, List, Set
+from NetUtils import NetworkItem
+from .Items import ItemData, item_code_table, item_table, get_starting_vanes
+from .Locations import location_table
+from .Patch import build_seed_info, read_options
+from .PatchFormat import PatchInfo
+from albwrandomizer import PyRandomizable, SeedInfo
+
+class ALBWTracker:
+    seed_info: SeedInfo
+    base_id: int
+    locations: List[str]
+    events: Dict[str, ItemData]
+    location_items: Dict[int, ItemData]
+    starting_items: List[ItemData]
+    item_counts: Dict[str, int]
+    randomizables: List[PyRandomizable]
+    in_logic: Set[str]
+    received_count: int
+    checked: Set[int]
+    changed: bool
+
+    def __init__(self, patch_info: PatchInfo, base_id: int):
+        self.seed_info = build_seed_info(patch_info)
+        self.base_id = base_id
+        self.locations = []
+        self.events = {}
+        self.location_items = {}
+        for loc_name, item_name in patch_info.check_map.items():
+            # only locations that exist in the multiworld are in item_names
+            if loc_name not in patch_info.item_names:
+                continue
+            loc = location_table[loc_name]
+            if loc.code is None:
+                self.events[loc_name] = item_table[item_name]
+                continue
+            self.locations.append(loc_name)
+            # own items are not sent back by the server, so they are collected from checked locations instead
+            if item_name != "AP Item":
+                self.location_items[loc.code + base_id] = item_table[item_name]
+        self.locations.sort()
+        self.starting_items = get_starting_vanes(read_options(patch_info.options))
+        self.reset()
+
+    def reset(self) -> None:
+        self.item_counts = {}
+        self.randomizables = []
+        self.in_logic = set()
+        self.received_count = 0
+        self.checked = set()
+        self.changed = True
+        for item in self.starting_items:
+            self._collect(item)
+        self._explore()
+
+    def _collect(self, item: ItemData) -> None:
+        count = self.item_counts.get(item.name, 0)
+        if count < len(item.progress):
+            self.randomizables.append(item.progress[count])
+        self.item_counts[item.name] = count + 1
+
+    def update(self, items_received: List[NetworkItem], locations_checked: Set[int]) -> bool:
+        """Collects newly received items and newly checked own items, and returns whether anything changed."""
+        if len(items_received) < self.received_count or not self.checked <= locations_checked:
+            self.reset()
+        new_items = items_received[self.received_count:]
+        new_checks = locations_checked - self.checked
+        if new_items or new_checks:
+            self._update(new_items, new_checks)
+            self.received_count = len(items_received)
+        changed = self.changed
+        self.changed = False
+        return changed
+
+    def _update(self, new_items: List[NetworkItem], new_checks: Set[int]) -> None:
+        collected = False
+        for network_item in new_items:
+            self._collect(item_code_table[network_item.item - self.base_id])
+            collected = True
+        for code in new_checks:
+            if code in self.location_items:
+                self._collect(self.location_items[code])
+                collected = True
+        self.checked |= new_checks
+        self.changed = True
+
+        if collected:
+            self._explore()
+
+    def _explore(self) -> None:
+        # Owned items only grow, so locations already in logic never need to be tested again.
+        # Events collected along the way can unlock more locations, so repeat until none are found.
+        pending = [name for name in self.locations + list(self.events) if name not in self.in_logic]
+        while True:
+            found_event = False
+            for name in pending:
+                if self.seed_info.can_reach(name, self.randomizables):
+                    self.in_logic.add(name)
+                    if name in self.events:
+                        self._collect(self.events[name])
+                        found_event = True
+            pending = [name for name in pending if name not in self.in_logic]
+            if not found_event:
+                break
+
+    def get_in_logic_unchecked(self) -> List[str]:
+        return [name for name in self.locations
+            if name in self.in_logic and location_table[name].code + self.base_id not in self.checked]
@@ -1,20 +1,30 @@
+import base64
+import concurrent.futures
+import json
+import logging
 import os
-import pickle
-from typing import ClassVar, Dict, List, Optional, Sequence, Tuple
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, ClassVar, Dict, List, Optional, Sequence, Tuple, Union
 from ..AutoWorld import WebWorld, World
 from BaseClasses import CollectionState, Item, ItemClassification, Location, LocationProgressType, MultiWorld, \
     Region, Tutorial
 from Fill import fill_restrictive, sweep_from_pool
-from settings import Group, UserFilePath
+from settings import Bool, Group, UserFilePath
 from worlds.LauncherComponents import Component, SuffixIdentifier, Type, components, launch_subprocess
 from worlds.generic.Rules import set_rule
-from .Items import ALBWItem, Items, ItemData, ItemType, all_items, item_table, vane_to_item, \
-    convenient_hyrule_vanes, convenient_lorule_vanes, hyrule_vanes, lorule_vanes
+from .Cache import get_library_version, get_settings_fingerprint, make_key
+from .Items import ALBWItem, Items, ItemData, ItemType, all_items, item_table, vane_to_item, get_starting_vanes
+from .Logic import ALBWLogic, EntranceRule, LocationRule, ReachabilitySnapshot, RegionSkeleton, RuleCache, RuleKey, \
+    minimize_requirements
 from .Locations import ALBWLocation, LocationData, LocationType, all_locations, dungeon_table, location_table, \
     dungeon_item_excludes
-from .Options import ALBWOptions, CrackShuffle, InitialCrackState, Keysy, LogicMode, NiceItems, WeatherVanes, \
-    create_randomizer_settings
-from .Patch import PatchInfo, ALBWProcedurePatch
+from .Options import ALBWOptions, InitialCrackState, Keysy, LogicMode, NiceItems, create_randomizer_settings, \
+    slot_data_options
+from .Patch import ALBWProcedurePatch, item_codes, location_codes
+from .PatchFormat import PatchInfo, write_patch_info
+from .Profiling import profiler
+from .Rom import validate_rom
 from albwrandomizer import ArchipelagoInfo, PyRandomizable, SeedInfo, randomize_pre_fill
 
 albw_base_id = 6242624000
@@ -51,9 +61,32 @@ class ALBWSettings(Group):
         
         @classmethod
         def validate(cls, path: str) -> None:
-            pass #TODO add validation; hashing doesn't work for 3ds roms
+            # hashing a whole 3ds rom is too slow, so only its header and game partition are checked
+            validate_rom(path)
+
+    class PatchCompressionLevel(int):
+        """Compression level of the patched mod archive, from 0 (stored, fastest) to 9 (smallest)."""
+
+    class PatchCompressionWorkers(int):
+        """Number of threads compressing the patched mod archive's files in parallel."""
+
+    class PatchCacheSize(int):
+        """Maximum size in megabytes of the on-disk cache of patched outputs, reused when the same patch is
+        opened again with the same ROM. Set to 0 to disable it."""
+
+    class NativeProfiling(Bool):
+        """Count and time randomizer logic calls during generation and patching, and log a summary by stage."""
+
+    class SlotDataRequirements(Bool):
+        """Precompute each location's sphere and minimal item requirements and add them to slot data,
+        for trackers that cannot run the randomizer's logic. This adds many logic checks to generation."""
 
     rom_file: ALBWRomFile = ALBWRomFile("Legend of Zelda, The - A Link Between Worlds (USA) (En,Fr,Es).3ds")
+    patch_compression_level: PatchCompressionLevel = PatchCompressionLevel(6)
+    patch_compression_workers: PatchCompressionWorkers = PatchCompressionWorkers(1)
+    patch_cache_size: PatchCacheSize = PatchCacheSize(256)
+    native_profiling: Union[NativeProfiling, bool] = False
+    slot_data_requirements: Union[SlotDataRequirements, bool] = False
 
 class ALBWWorld(World):
     """
@@ -81,6 +114,16 @@ class ALBWWorld(World):
 
     seed: Optional[int]
     seed_info: Optional[SeedInfo]
+    slot_data_vanes: Dict[str, str]
+    slot_data_prizes: Dict[str, str]
+    spheres: Optional[Dict[int, int]]
+    location_index: Dict[str, ALBWLocation]
+    category_index: Dict[LocationType, List[ALBWLocation]]
+    rule_cache: RuleCache
+
+    RULE_CACHE_SIZE: ClassVar[int] = 1 << 16
+    REGION_SKELETON_CACHE_SIZE: ClassVar[int] = 8
+    region_skeletons: ClassVar["OrderedDict[str, RegionSkeleton]"] = OrderedDict()
 
     def create_item(self, name: str) -> ALBWItem:
         item_id = self.item_name_to_id[name] if name in self.item_name_to_id else None
@@ -99,41 +142,60 @@ class ALBWWorld(World):
         return self.random.choice(filler_items)
     
     def generate_early(self) -> None:
+        if self.player == min(self.multiworld.get_game_players(self.game)):
+            profiler.reset()
+            profiler.enabled = bool(self.settings.native_profiling)
+        profiler.set_stage("generate_early")
+        self.rule_cache = RuleCache(self.RULE_CACHE_SIZE)
         self.seed = self.random.randrange(2**32)
-        settings = create_randomizer_settings(self.options)
-        archipelago_info = ArchipelagoInfo()
-        archipelago_info.name = self.player_name
-        self.seed_info = randomize_pre_fill(self.seed, settings, archipelago_info)
+        self.seed_info = None
+        self.slot_data_vanes = {}
+        self.slot_data_prizes = {}
+        self.spheres = None
+
+        # Universal Tracker regenerates the world from slot data, restoring the seed and options used
+        re_gen_passthrough = getattr(self.multiworld, "re_gen_passthrough", {})
+        if self.game in re_gen_passthrough:
+            self._apply_slot_data(re_gen_passthrough[self.game])
 
         # add starting weather vanes
-        starting_vanes = []
-        if self.options.weather_vanes in [WeatherVanes.option_hyrule, WeatherVanes.option_all]:
-            starting_vanes += hyrule_vanes
-        if self.options.weather_vanes in [WeatherVanes.option_lorule, WeatherVanes.option_all]:
-            starting_vanes += lorule_vanes
-        if self.options.weather_vanes == WeatherVanes.option_convenient:
-            starting_vanes += convenient_hyrule_vanes
-            if not self.options.crack_shuffle == CrackShuffle.option_off:
-                starting_vanes += convenient_lorule_vanes
-        for vane in starting_vanes:
+        for vane in get_starting_vanes(self.options):
             self.options.start_inventory.value[vane.name] = 1
+
+    @classmethod
+    def stage_generate_early(cls, multiworld: MultiWorld) -> None:
+        # Pre-fill doesn't depend on the rest of the multiworld, so compute every ALBW player's concurrently.
+        # Seeds were already drawn in generate_early, and results are matched to players by position.
+        worlds: List[ALBWWorld] = list(multiworld.get_game_worlds(cls.game))
+        if not worlds:
+            return
+        max_workers = min(len(worlds), os.cpu_count() or 1)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            seed_infos = list(executor.map(lambda world: world._randomize_pre_fill(), worlds))
+        for world, seed_info in zip(worlds, seed_infos):
+            world.seed_info = seed_info
+
+    def _randomize_pre_fill(self) -> SeedInfo:
+        settings = create_randomizer_settings(self.options)
+        archipelago_info = ArchipelagoInfo()
+        archipelago_info.name = self.player_name
+        with profiler.in_stage("generate_early"):
+            return profiler.call("randomize_pre_fill", randomize_pre_fill, self.seed, settings, archipelago_info)
     
     def create_regions(self) -> None:
+        profiler.set_stage("create_regions")
         menu_region = Region("Menu", self.player, self.multiworld)
         self.multiworld.regions.append(menu_region)
 
-        assert self.seed_info is not None
-        region_graph = self.seed_info.get_region_graph()
+        skeleton = self._get_region_skeleton()
+        self.location_index = {}
+        self.category_index = {loctype: [] for loctype in LocationType}
 
         # generate regions and locations
-        for (region_name, (locations, _)) in region_graph.items():
+        for (region_name, locations) in skeleton.regions:
             region = Region(region_name, self.player, self.multiworld)
             self.multiworld.regions.append(region)
             for location_name in locations:
-                # skip locations like hint ghosts without AP counterparts
-                if location_name not in location_table:
-                    continue
-
                 loc_data = location_table[location_name]
                 if self._is_unrandomized(loc_data):
                     continue
@@ -152,30 +214,40 @@ class ALBWWorld(World):
                 if item is not None:
                     location.place_locked_item(self.create_item(item.name))
 
-                set_rule(location, lambda state, location_name=location_name:
-                    self.seed_info.can_reach(location_name, self._convert_state(state)))
+                set_rule(location, LocationRule(self, location_name))
                 region.locations.append(location)
+                self.location_index[location_name] = location
+                self.category_index[loc_data.loctype].append(location)
 
         ravio_shop_region = self.multiworld.get_region("RavioShop", self.player)
         menu_region.connect(ravio_shop_region)
 
         # generate connections
-        path_counts = {}
-        for (source_region_name, (_, paths)) in region_graph.items():
-            for target_region_name in paths:
-                source_region = self.multiworld.get_region(source_region_name, self.player)
-                target_region = self.multiworld.get_region(target_region_name, self.player)
-                name = f"{source_region_name} -> {target_region_name}"
-                if name in path_counts.keys():
-                    path_counts[name] += 1
-                    name = f"{name} [{path_counts[name]}]"
-                else:
-                    path_counts[name] = 1
-                source_region.connect(target_region, name=name, rule=
-                    lambda state, source_region_name=source_region_name, target_region_name=target_region_name:
-                    self.seed_info.can_traverse(source_region_name, target_region_name, self._convert_state(state)))
+        for (source_region_name, target_region_name, name) in skeleton.edges:
+            source_region = self.multiworld.get_region(source_region_name, self.player)
+            target_region = self.multiworld.get_region(target_region_name, self.player)
+            source_region.connect(target_region, name=name,
+                rule=EntranceRule(self, source_region_name, target_region_name))
+
+    def _get_region_skeleton(self) -> RegionSkeleton:
+        # With crack shuffle off, the graph's topology only depends on the settings, so players sharing settings
+        # share one converted skeleton. Seed-specific parts like the weather vane map are still read per player.
+        key = make_key(get_settings_fingerprint(create_randomizer_settings(self.options)), get_library_version())
+        # Only the most recently used settings are kept, so a long-lived generator process doesn't keep one
+        # skeleton for every settings combination it has seen.
+        skeleton = self.region_skeletons.get(key)
+        if skeleton is None:
+            assert self.seed_info is not None
+            skeleton = RegionSkeleton(self.seed_info.get_region_graph())
+            self.region_skeletons[key] = skeleton
+            if len(self.region_skeletons) > self.REGION_SKELETON_CACHE_SIZE:
+                self.region_skeletons.popitem(last=False)
+        else:
+            self.region_skeletons.move_to_end(key)
+        return skeleton
     
     def create_items(self) -> None:
+        profiler.set_stage("create_items")
         self.itempool = []
         self.pre_fill_items = []
         if self.options.assured_weapon:
@@ -196,77 +268,243 @@ class ALBWWorld(World):
                 self.itempool.append(self.create_item(item.name))
         
         num_items = len(self.itempool) + len(self.pre_fill_items)
-        num_locations = len(self.multiworld.get_unfilled_locations(self.player))
+        num_locations = sum(1 for loc in self.location_index.values() if loc.item is None)
         for _ in range(num_locations - num_items):
             self.itempool.append(self.create_filler())
         
         self.random.shuffle(self.itempool)
         self.multiworld.itempool.extend(self.itempool)
 
+    def collect(self, state: CollectionState, item: Item) -> bool:
+        change = super().collect(state, item)
+        if change:
+            progress = item_table[item.name].progress
+            count = state.prog_items[self.player][item.name]
+            if count <= len(progress):
+                state.albw_randomizables[self.player].append(progress[count - 1])
+                state.albw_reachability[self.player] = ReachabilitySnapshot()
+        return change
+
+    def remove(self, state: CollectionState, item: Item) -> bool:
+        change = super().remove(state, item)
+        if change:
+            progress = item_table[item.name].progress
+            count = state.prog_items[self.player][item.name]
+            if count < len(progress):
+                # drop the copy that was added when this item was collected
+                randomizables = state.albw_randomizables[self.player]
+                for i in range(len(randomizables) - 1, -1, -1):
+                    if randomizables[i] is progress[count]:
+                        del randomizables[i]
+                        break
+                state.albw_reachability[self.player] = ReachabilitySnapshot()
+        return change
+
     def set_rules(self) -> None:
+        profiler.set_stage("set_rules")
         self.multiworld.completion_condition[self.player] = lambda state: state.has("Triforce", self.player)
     
-    def pre_fill(self) -> None:
+    @classmethod
+    def stage_pre_fill(cls, multiworld: MultiWorld) -> None:
+        # Place every ALBW player's prizes, dungeon items and assured weapon in a single restricted fill, so the
+        # item pool is collected and swept once rather than once per group and player. Each item may only go
+        # to a location of its own group; items not yet placed still count as collected, as before.
+        profiler.set_stage("pre_fill")
+        worlds: List[ALBWWorld] = list(multiworld.get_game_worlds(cls.game))
+        itempool: List[Item] = []
+        locations: List[Location] = []
+        item_groups: Dict[int, Tuple[int, int]] = {}
+        location_groups: Dict[int, Tuple[int, int]] = {}
+        for world in worlds:
+            player_itempool = []
+            for group_id, (group_itempool, group_locations) in enumerate(world._get_pre_fill_groups()):
+                group = (world.player, group_id)
+                # a location belongs to the first group that claims it, e.g. prizes before dungeon items
+                group_locations = [loc for loc in group_locations if loc.item is None and id(loc) not in location_groups]
+                world.random.shuffle(group_locations)
+                for loc in group_locations:
+                    location_groups[id(loc)] = group
+                for item in group_itempool:
+                    item_groups[id(item)] = group
+                locations.extend(group_locations)
+                player_itempool.extend(group_itempool)
+            # fill_restrictive places items from the end of the pool first
+            itempool.extend(reversed(player_itempool))
+        if not itempool:
+            profiler.set_stage("fill")
+            return
+
+        state = sweep_from_pool(CollectionState(multiworld), [item for world in worlds for item in world.itempool])
+        item_rules = {id(loc): loc.item_rule for loc in locations}
+        for loc in locations:
+            loc.item_rule = lambda item, loc=loc, item_rule=item_rules[id(loc)]: \
+                item_groups.get(id(item)) == location_groups[id(loc)] and item_rule(item)
+        try:
+            fill_restrictive(multiworld, state, locations, itempool, single_player_placement=True, lock=True,
+                allow_excluded=True, allow_partial=False, name="ALBW Pre-Fill")
+        finally:
+            for loc in locations:
+                loc.item_rule = item_rules[id(loc)]
+            profiler.set_stage("fill")
+
+    def _get_pre_fill_groups(self) -> List[Tuple[List[Item], List[ALBWLocation]]]:
+        groups = []
+
         # randomize dungeon prizes
         if self.options.randomize_dungeon_prizes:
             prize_itempool = [item for item in self.pre_fill_items if item_table[item.name].itemtype == ItemType.Prize]
-            prize_location_names = [loc.name for loc in all_locations if loc.loctype == LocationType.Prize]
-            self._initial_fill(prize_itempool, prize_location_names)
+            groups.append((prize_itempool, self.category_index[LocationType.Prize]))
 
         # randomize dungeon items
         for dungeon in dungeon_table:
-            dungeon_itempool = [item for item in self.pre_fill_items if item_table[item.name] in dungeon.items]
-            if dungeon.name == "Lorule Castle" and self.options.bow_of_light_in_castle:
-                dungeon_itempool.append(self.create_item(Items.BowOfLight.name))
-            dungeon_location_names = [loc.name for loc in dungeon.locations if loc.name not in dungeon_item_excludes]
-            self._initial_fill(dungeon_itempool, dungeon_location_names)
+            dungeon_item_names = {item.name for item in dungeon.items}
+            if dungeon.name == "Lorule Castle":
+                dungeon_item_names.add(Items.BowOfLight.name)
+            dungeon_itempool = [item for item in self.pre_fill_items if item.name in dungeon_item_names]
+            dungeon_locations = [self.location_index[loc.name] for loc in dungeon.locations
+                if loc.name in self.location_index and loc.name not in dungeon_item_excludes]
+            groups.append((dungeon_itempool, dungeon_locations))
         
         # starting weapon
         if self.starting_weapon is not None:
             starting_weapon_itempool = [item for item in self.pre_fill_items if item.name == self.starting_weapon.name]
-            ravio_location_names = [loc.name for loc in all_locations if loc.loctype == LocationType.Ravio]
-            self._initial_fill(starting_weapon_itempool, ravio_location_names)
+            groups.append((starting_weapon_itempool, self.category_index[LocationType.Ravio]))
+
+        return groups
     
-    def fill_slot_data(self) -> None:
-        return {"seed": self.seed}
+    def _get_spheres(self) -> Dict[int, int]:
+        # Computed from slot data, after progression balancing has moved items, once for the whole multiworld
+        # and shared by every ALBW player
+        if self.spheres is None:
+            spheres: Dict[int, int] = {}
+            for sphere, sphere_locations in enumerate(self.multiworld.get_spheres()):
+                for loc in sphere_locations:
+                    spheres[id(loc)] = sphere
+            for world in self.multiworld.get_game_worlds(self.game):
+                world.spheres = spheres
+        assert self.spheres is not None
+        return self.spheres
+
+    def _build_requirements(self) -> Dict[str, Tuple[int, Dict[str, int]]]:
+        # start from every progression item this player can own, then reduce it for each location
+        counts: Dict[str, int] = {}
+        for item in self.multiworld.precollected_items[self.player] + list(self.multiworld.get_items()):
+            if item.player == self.player and item.game == self.game and item_table[item.name].progress:
+                counts[item.name] = min(counts.get(item.name, 0) + 1, len(item_table[item.name].progress))
+
+        def is_sufficient(location_name: str, required: Dict[str, int]) -> bool:
+            # the fingerprint matches _get_fingerprint's, so results are shared with rules evaluated during fill
+            fingerprint_id = self.rule_cache.get_fingerprint_id(tuple(sorted(required.items())))
+            return self._check_cached(location_name, fingerprint_id, lambda: profiler.call("can_reach",
+                self.seed_info.can_reach, location_name, [randomizable for name, count in required.items()
+                    for randomizable in item_table[name].progress[:count]]))
+
+        spheres = self._get_spheres()
+        requirements = {}
+        for name, loc in self.location_index.items():
+            if id(loc) not in spheres:
+                continue
+            requirements[name] = (spheres[id(loc)],
+                minimize_requirements(counts, lambda required: is_sufficient(name, required)))
+        return requirements
+
+    def fill_slot_data(self) -> Dict[str, Any]:
+        slot_data = {
+            "seed": self.seed,
+            "options": self.options.as_dict(*slot_data_options),
+            "vane_map": {loc.name: loc.item.name for loc in self.category_index[LocationType.Vane]},
+            "prizes": {loc.name: loc.item.name for loc in self.category_index[LocationType.Prize]},
+        }
+        if self.settings.slot_data_requirements:
+            # location name -> [sphere, {item name: count}], as zlib compressed and base64 encoded JSON
+            with profiler.in_stage("slot_data"):
+                requirements = self._build_requirements()
+            table = json.dumps(requirements, separators=(",", ":"), sort_keys=True).encode("utf-8")
+            slot_data["requirements"] = base64.b64encode(zlib.compress(table, 9)).decode("ascii")
+        return slot_data
+
+    @staticmethod
+    def interpret_slot_data(slot_data: Dict[str, Any]) -> Dict[str, Any]:
+        # returned to generate_early through multiworld.re_gen_passthrough
+        return slot_data
+
+    def _apply_slot_data(self, slot_data: Dict[str, Any]) -> None:
+        self.seed = slot_data["seed"]
+        for name, value in slot_data.get("options", {}).items():
+            option = getattr(self.options, name, None)
+            if option is not None:
+                setattr(self.options, name, type(option).from_any(value))
+        # placed items are used as exported, so checks gated by portraits or pendants are tracked correctly
+        self.slot_data_vanes = slot_data.get("vane_map", {})
+        self.slot_data_prizes = slot_data.get("prizes", {})
 
     def generate_output(self, output_directory: str) -> None:
         # Create patch info object
-        check_map = self._build_check_map()
-        item_names = {loc.name: loc.item.name for loc in self.multiworld.get_locations(self.player)}
-        patch_info = PatchInfo(PatchInfo.version, self.seed, self.player_name, self.options, check_map, item_names)
+        with profiler.in_stage("output"):
+            check_map = self._build_check_map()
+        item_names = {name: loc.item.name for name, loc in self.location_index.items()}
+        patch_info = PatchInfo(PatchInfo.version, self.seed, self.player_name,
+            self.options.as_dict(*slot_data_options), check_map, item_names)
 
         # Write patch info to binary file
         patch = ALBWProcedurePatch(player=self.player, player_name=self.player_name)
-        patch.write_file("patch_info.bin", pickle.dumps(patch_info))
+        patch.write_file("patch_info.bin", write_patch_info(patch_info, location_codes, item_codes))
 
         # Write patch file
         out_file_name = self.multiworld.get_out_file_name_base(self.player)
         patch.write(os.path.join(output_directory, f"{out_file_name}{patch.patch_file_ending}"))
+
+        logging.debug(f"ALBW rule cache for {self.player_name}: {self.rule_cache.hits} hits, "
+            f"{self.rule_cache.misses} misses ({self.rule_cache.hit_rate():.1%} hit rate)")
     
-    def _initial_fill(self, itempool: List[Item], location_names: List[str]) -> None:
-        for item in itempool:
-            self.pre_fill_items.remove(item)
-        state = CollectionState(self.multiworld)
-        for item in self.pre_fill_items:
-            state.collect(item)
-        state = sweep_from_pool(state, self.itempool)
-        locations = [loc for loc in self.multiworld.get_unfilled_locations(self.player) if loc.name in location_names]
-        self.random.shuffle(locations)
-        fill_restrictive(self.multiworld, state, locations, itempool,
-            single_player_placement=True, lock=True, allow_excluded=True, allow_partial=False)
+    def modify_multidata(self, multidata: Dict) -> None:
+        # AP writes multidata on the output pool, so other worlds' output and the accessibility check may still be
+        # running, and calls they make after this point are missing from the report
+        if profiler.enabled and self.player == max(self.multiworld.get_game_players(self.game)):
+            logging.info(f"ALBW native call profile (partial, calls still running on the output pool are not "
+                f"included):\n{profiler.report()}")
 
     def _convert_state(self, state: CollectionState) -> List[PyRandomizable]:
-        randomizables = []
-        for (name, count) in state.prog_items[self.player].items():
-            item = item_table[name]
-            randomizables.extend(item.progress[:count])
-        return randomizables
+        if profiler.enabled:
+            # only counted, since the state is kept converted by collect and remove
+            profiler.record("_convert_state", 0.0)
+        return state.albw_randomizables[self.player]
+
+    def _can_reach(self, state: CollectionState, location_name: str) -> bool:
+        return self._check_rule(state, location_name, lambda: profiler.call("can_reach",
+            self.seed_info.can_reach, location_name, self._convert_state(state)))
+
+    def _can_traverse(self, state: CollectionState, source_region_name: str, target_region_name: str) -> bool:
+        return self._check_rule(state, (source_region_name, target_region_name), lambda: profiler.call("can_traverse",
+            self.seed_info.can_traverse, source_region_name, target_region_name, self._convert_state(state)))
+
+    def _check_rule(self, state: CollectionState, key: RuleKey, evaluate: Callable[[], bool]) -> bool:
+        # first look in the state's own snapshot, then in the cache shared by all states with the same progression
+        snapshot = state.albw_reachability[self.player]
+        if key not in snapshot.results:
+            if snapshot.fingerprint_id is None:
+                snapshot.fingerprint_id = self.rule_cache.get_fingerprint_id(self._get_fingerprint(state))
+            snapshot.results[key] = self._check_cached(key, snapshot.fingerprint_id, evaluate)
+        return snapshot.results[key]
+
+    def _check_cached(self, key: RuleKey, fingerprint_id: int, evaluate: Callable[[], bool]) -> bool:
+        result = self.rule_cache.get((key, fingerprint_id))
+        if result is None:
+            result = evaluate()
+            self.rule_cache.put((key, fingerprint_id), result)
+        return result
+
+    def _get_fingerprint(self, state: CollectionState) -> Tuple[Tuple[str, int], ...]:
+        # Copies beyond the randomizer's progressive list do not affect logic, and items without one are left out.
+        # The fingerprint covers the player's whole progression: the randomizer does not say which items a rule
+        # depends on, so states differing only in items irrelevant to a rule still get separate entries.
+        return tuple(sorted((name, min(count, len(item_table[name].progress)))
+            for name, count in state.prog_items[self.player].items() if count > 0 and item_table[name].progress))
     
     def _build_check_map(self) -> Dict[str, str]:
         # Replace all non-local items with Letter in a Bottle
-        check_map = {loc.name: loc.item.name if loc.item.player == self.player
-            else "AP Item" for loc in self.multiworld.get_locations(self.player)}
+        check_map = {name: loc.item.name if loc.item.player == self.player
+            else "AP Item" for name, loc in self.location_index.items()}
         
         # Fill in unrandomized Maiamai
         if not self.options.maiamai_mayhem:
@@ -293,7 +531,8 @@ class ALBWWorld(World):
 
     def _get_item_count(self, item: ItemData):
         if item.itemtype == ItemType.Prize and self.options.randomize_dungeon_prizes:
-            return 1
+            # prizes known from slot data are placed directly at their locations
+            return 0 if self.slot_data_prizes else 1
         if item.is_event():
             return 0
         if item.itemtype == ItemType.Junk:
@@ -320,7 +559,10 @@ class ALBWWorld(World):
         # if location.loctype == LocationType.Upgrade and self.options.nice_mode:
         #     return None
         if location.loctype == LocationType.Prize and self.options.randomize_dungeon_prizes:
-            return None
+            prize_name = self.slot_data_prizes.get(location.name)
+            return item_table[prize_name] if prize_name is not None else None
+        if location.name in self.slot_data_vanes:
+            return item_table[self.slot_data_vanes[location.name]]
         if location.loctype == LocationType.Vane:
             assert self.seed_info is not None
             assert location.default_item is not None and location.default_item.vane is not None
@@ -0,0 +1,50 @@
+import io
+import os
+import tempfile
+import unittest
+import zipfile
+from ..Archive import write_zip
+
+class TestWriteZip(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.files = {
+            "code.bin": bytes(range(256)) * 64,
+            "romfs/Msbt/Common.msbt": b"Link " * 4096,
+            "romfs/World/Byaml/empty.byaml": b"",
+            "romfs/World/Byaml/Dün.byaml": os.urandom(5000),
+        }
+        for name, data in self.files.items():
+            path = os.path.join(self.directory.name, *name.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                file.write(data)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def check_round_trip(self, level: int, workers: int) -> None:
+        output = io.BytesIO()
+        write_zip(self.directory.name, output, level, workers)
+        with zipfile.ZipFile(output) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(sorted(archive.namelist()), sorted(self.files))
+            for name, data in self.files.items():
+                self.assertEqual(archive.read(name), data, name)
+                expected = zipfile.ZIP_STORED if level == 0 else zipfile.ZIP_DEFLATED
+                self.assertEqual(archive.getinfo(name).compress_type, expected, name)
+
+    def test_parallel_round_trip(self) -> None:
+        for level in (0, 6, 9):
+            with self.subTest(level=level):
+                self.check_round_trip(level, 4)
+
+    def test_zipfile_round_trip(self) -> None:
+        for level in (0, 6, 9):
+            with self.subTest(level=level):
+                self.check_round_trip(level, 1)
+
+    def test_invalid_level_rejected(self) -> None:
+        for level in (-1, 10):
+            with self.subTest(level=level), self.assertRaises(ValueError):
+                write_zip(self.directory.name, io.BytesIO(), level, 4)
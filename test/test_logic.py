@@ -0,0 +1,41 @@
+import unittest
+from ..Logic import RuleCache, minimize_requirements
+
+class TestRuleCache(unittest.TestCase):
+    def test_hits_and_misses(self) -> None:
+        cache = RuleCache(4)
+        fingerprint_id = cache.get_fingerprint_id((("Bow", 1),))
+        self.assertEqual(cache.get_fingerprint_id((("Bow", 1),)), fingerprint_id)
+        self.assertIsNone(cache.get(("[EP] Prize", fingerprint_id)))
+        cache.put(("[EP] Prize", fingerprint_id), True)
+        self.assertTrue(cache.get(("[EP] Prize", fingerprint_id)))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_evicted_fingerprint_gets_fresh_id(self) -> None:
+        cache = RuleCache(1)
+        first_id = cache.get_fingerprint_id((("Bow", 1),))
+        cache.put(("Ravio's Gift", first_id), False)
+        cache.get_fingerprint_id((("Hookshot", 1),))
+        self.assertNotEqual(cache.get_fingerprint_id((("Bow", 1),)), first_id)
+
+    def test_entries_are_bounded(self) -> None:
+        cache = RuleCache(2)
+        for key in ["a", "b", "c"]:
+            cache.put((key, 0), True)
+        self.assertIsNone(cache.get(("a", 0)))
+        self.assertTrue(cache.get(("c", 0)))
+        cache.clear()
+        self.assertIsNone(cache.get(("c", 0)))
+
+class TestMinimizeRequirements(unittest.TestCase):
+    def test_drops_unneeded_items_and_lowers_counts(self) -> None:
+        # reachable with a Bow and at least two swords, or with Bombs
+        def is_sufficient(required):
+            return (required.get("Bow", 0) >= 1 and required.get("Progressive Sword", 0) >= 2) \
+                or required.get("Bombs", 0) >= 1
+
+        counts = {"Bow": 1, "Progressive Sword": 4, "Hookshot": 1}
+        self.assertEqual(minimize_requirements(counts, is_sufficient), {"Bow": 1, "Progressive Sword": 2})
+
+    def test_no_requirements(self) -> None:
+        self.assertEqual(minimize_requirements({"Bow": 1}, lambda required: True), {})
@@ -0,0 +1,53 @@
+import pickle
+import unittest
+from ..PatchFormat import PATCH_INFO_MAGIC, PatchInfo, read_patch_info, write_patch_info
+from ..Patch import item_codes, location_codes, read_options
+from Utils import Version
+
+class TestPatchInfo(unittest.TestCase):
+    def make_patch_info(self) -> PatchInfo:
+        options = {"logic_mode": 2, "keysy": 3, "randomize_dungeon_prizes": 1}
+        check_map = {
+            "Ravio's Gift": "Bow",
+            "Ravio's Shop (1)": "AP Item",
+            "[EP] Prize": "Pendant of Courage",
+            "Thieves' Town Item Shop (2)": "Gold Bee",
+        }
+        item_names = {
+            "Ravio's Gift": "Bow",
+            "Ravio's Shop (1)": "Progressive Sword",
+            "[EP] Prize": "Pendant of Courage",
+        }
+        return PatchInfo(PatchInfo.version, 12345, "Player1", options, check_map, item_names)
+
+    def test_round_trip(self) -> None:
+        patch_info = self.make_patch_info()
+        data = write_patch_info(patch_info, location_codes, item_codes)
+        self.assertTrue(data.startswith(PATCH_INFO_MAGIC))
+
+        loaded = read_patch_info(data, location_codes, item_codes)
+        self.assertEqual(loaded.version, patch_info.version)
+        self.assertEqual(loaded.seed, patch_info.seed)
+        self.assertEqual(loaded.player_name, patch_info.player_name)
+        self.assertEqual(loaded.options, patch_info.options)
+        self.assertEqual(loaded.check_map, patch_info.check_map)
+        self.assertEqual(loaded.item_names, patch_info.item_names)
+
+    def test_missing_options_use_defaults(self) -> None:
+        options = read_options({})
+        self.assertEqual(options.logic_mode.value, type(options.logic_mode).default)
+
+    def test_newer_version_rejected(self) -> None:
+        patch_info = self.make_patch_info()
+        patch_info.version = Version(PatchInfo.version.major + 1, 0, 0)
+        with self.assertRaises(Exception):
+            read_patch_info(write_patch_info(patch_info, location_codes, item_codes), location_codes, item_codes)
+
+    def test_pickled_patch_rejected(self) -> None:
+        # pickles could run arbitrary code, so patches from before the compact format are refused unread
+        class Payload:
+            def __reduce__(self):
+                return exec, ("raise AssertionError('pickle was loaded')",)
+
+        with self.assertRaisesRegex(Exception, "older version"):
+            read_patch_info(pickle.dumps(Payload()), location_codes, item_codes)
@@ -0,0 +1,43 @@
+import unittest
+from ..Rom import TITLE_ID, check_rom, get_sample_offsets, SAMPLE_COUNT, SAMPLE_SIZE
+
+PARTITION_UNITS = 0x20
+
+def make_rom(title_id: int = TITLE_ID, decrypted: bool = True, truncate: int = 0) -> bytes:
+    rom = bytearray(0x200 + PARTITION_UNITS * 0x200 * 2)
+    rom[0x100:0x104] = b"NCSD"
+    rom[0x108:0x110] = title_id.to_bytes(8, "little")
+    rom[0x120:0x124] = PARTITION_UNITS.to_bytes(4, "little")
+    rom[0x124:0x128] = PARTITION_UNITS.to_bytes(4, "little")
+    partition_offset = PARTITION_UNITS * 0x200
+    rom[partition_offset + 0x100:partition_offset + 0x104] = b"NCCH"
+    if decrypted:
+        rom[partition_offset + 0x18F] = 0x4
+    return bytes(rom[:len(rom) - truncate])
+
+class TestCheckRom(unittest.TestCase):
+    def test_valid_rom(self) -> None:
+        self.assertIsNone(check_rom(make_rom()))
+
+    def test_not_a_rom(self) -> None:
+        self.assertIsNotNone(check_rom(b"\0" * 0x1000))
+
+    def test_wrong_title(self) -> None:
+        self.assertIsNotNone(check_rom(make_rom(title_id=0x00040000000EC400)))
+
+    def test_encrypted(self) -> None:
+        self.assertIn("encrypted", check_rom(make_rom(decrypted=False)))
+
+    def test_truncated(self) -> None:
+        self.assertIn("truncated", check_rom(make_rom(truncate=PARTITION_UNITS * 0x200 + 1)))
+
+class TestSampleOffsets(unittest.TestCase):
+    def test_small_file_is_fully_covered(self) -> None:
+        self.assertEqual(get_sample_offsets(SAMPLE_SIZE * 2 + 1), [0, SAMPLE_SIZE, SAMPLE_SIZE * 2])
+
+    def test_large_file_samples_span_it(self) -> None:
+        size = SAMPLE_SIZE * SAMPLE_COUNT * 10
+        offsets = get_sample_offsets(size)
+        self.assertEqual(len(offsets), SAMPLE_COUNT)
+        self.assertEqual(offsets[0], 0)
+        self.assertLessEqual(offsets[-1] + SAMPLE_SIZE, size)